@@ -0,0 +1,100 @@
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.sparse.csgraph import connected_components
+
+from ols import Clusters
+
+
+class Absorbed:
+    """
+    Fixed effects for one or more factors, to be absorbed by demeaning (the
+    within transformation) instead of being added to X as dummy columns.
+
+    `factors` is a list of label arrays, one per factor, aligned with the rows.
+    """
+
+    def __init__(self, factors, tol=1e-10, max_iter=10_000):
+        self.factors = [f if isinstance(f, Clusters) else Clusters(f) for f in factors]
+        self.counts = [np.bincount(f.codes, minlength=len(f)) for f in self.factors]
+        self.tol = tol
+        self.max_iter = max_iter
+
+    def sweep(self, values):
+        """One round of projections: subtract each factor's means in turn, in place."""
+        for f, counts in zip(self.factors, self.counts):
+            values -= (f.sums(values) / counts[:, None])[f.codes]
+
+    def demean(self, values):
+        """
+        Subtract the fixed effects from each column of `values`. A single
+        factor is exact (group means); several are absorbed by alternating
+        projections, until no value changes by more than `tol` in a round.
+
+        The projections are accelerated with Irons and Tuck's extrapolation
+        (as in the R package fixest), which needs far fewer rounds when the
+        factors are weakly connected, e.g. employers who each saw a few of
+        many applicants.
+        """
+        values = np.array(values, dtype=float)
+        vector = values.ndim == 1
+        if vector:
+            values = values[:, None]
+        self.sweep(values)
+        if len(self.factors) > 1:
+            self.iterations = 0
+            while True:
+                once = values.copy()
+                self.sweep(once)
+                twice = once.copy()
+                self.sweep(twice)
+                step = twice - once
+                if np.abs(step).max(initial=0) < self.tol:
+                    values = twice
+                    break
+                curvature = step - (once - values)
+                ssq = np.einsum('ij,ij->j', curvature, curvature)
+                ratio = np.divide(
+                    np.einsum('ij,ij->j', step, curvature), ssq,
+                    out=np.zeros_like(ssq), where=ssq > 0,
+                )
+                values = twice - ratio * step
+                self.iterations += 1
+                if self.iterations >= self.max_iter:
+                    raise RuntimeError(f'demeaning did not converge in {self.max_iter} iterations')
+        return values[:, 0] if vector else values
+
+    def df(self, clusters=None):
+        """
+        Degrees of freedom used by the fixed effects (the number of dummies,
+        constant included, that they'd need to be identified): the total number
+        of levels, less one per extra factor, or less one per connected
+        component of the two factors' levels for two factors.
+
+        With `clusters`, factors nested within the clusters count as a single
+        level, as they don't reduce the variation that the cluster-robust
+        variance uses (as in Stata's reghdfe).
+        """
+        factors = [
+            f for f in self.factors
+            if clusters is None or not nested(f, clusters)
+        ]
+        if not factors:
+            return 1
+        levels = sum(len(f) for f in factors)
+        if len(factors) == 2:
+            a, b = factors
+            # bipartite graph of the levels, with an edge for each row
+            graph = sparse.coo_matrix(
+                (np.ones(len(a.codes)), (a.codes, len(a) + b.codes)), shape=(levels, levels)
+            )
+            n_components, _ = connected_components(graph, directed=False)
+            return levels - n_components
+        return levels - (len(factors) - 1)
+
+
+def nested(factor, clusters):
+    """Whether each level of `factor` lies within a single cluster."""
+    return bool(
+        (pd.Series(clusters.codes).groupby(factor.codes).nunique() == 1).all()
+    )
@@ -0,0 +1,88 @@
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+
+class BidGraph:
+    """
+    Index of the employer-applicant bids in df_bids, as a bipartite graph stored
+    in CSR (by employer) and CSC (by applicant) layouts.
+
+    `values` holds the per-bid columns (bid, perform_guess, approp_rating,
+    treatment by default) as arrays aligned with the CSR layout: the bids of
+    employer i are values[...][indptr[i]:indptr[i + 1]], on applicants
+    indices[indptr[i]:indptr[i + 1]], in their original order. An employer can
+    bid on the same applicant more than once (with different self-promotion
+    types), so repeated pairs are kept as separate entries.
+    """
+
+    def __init__(self, df_bids, columns=('bid', 'perform_guess', 'approp_rating', 'treatment')):
+        self.employers = pd.Index(df_bids.index.unique())
+        self.applicants = pd.Index(df_bids['applicant'].unique())
+        emp = self.employers.get_indexer(df_bids.index)
+        app = self.applicants.get_indexer(df_bids['applicant'])
+
+        # CSR: bids grouped by employer (stable, so each employer's bids stay in order)
+        order = np.argsort(emp, kind='stable')
+        self.indptr = np.zeros(len(self.employers) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(emp, minlength=len(self.employers)), out=self.indptr[1:])
+        self.indices = app[order]
+        self.values = {c: df_bids[c].to_numpy()[order] for c in columns}
+
+        # CSC: positions in the CSR arrays, grouped by applicant
+        self.csc_order = np.argsort(self.indices, kind='stable')
+        self.csc_indptr = np.zeros(len(self.applicants) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.indices, minlength=len(self.applicants)), out=self.csc_indptr[1:])
+        self.employer_of = np.repeat(np.arange(len(self.employers)), np.diff(self.indptr))
+
+    def __len__(self):
+        return len(self.indices)
+
+    def employer_degree(self):
+        return pd.Series(np.diff(self.indptr), index=self.employers)
+
+    def applicant_degree(self):
+        return pd.Series(np.diff(self.csc_indptr), index=self.applicants)
+
+    def bids_by(self, employer):
+        """The bids made by `employer`, as a frame indexed by applicant."""
+        i = self.employers.get_loc(employer)
+        s = slice(self.indptr[i], self.indptr[i + 1])
+        return pd.DataFrame(
+            {c: v[s] for c, v in self.values.items()},
+            index=self.applicants[self.indices[s]].rename('applicant'),
+        )
+
+    def bids_on(self, applicant):
+        """The bids made on `applicant`, as a frame indexed by employer."""
+        j = self.applicants.get_loc(applicant)
+        pos = self.csc_order[self.csc_indptr[j]:self.csc_indptr[j + 1]]
+        return pd.DataFrame(
+            {c: v[pos] for c, v in self.values.items()},
+            index=self.employers[self.employer_of[pos]].rename('employer'),
+        )
+
+    def employer_first(self, column):
+        """The first bid's `column` value for each employer."""
+        return pd.Series(self.values[column][self.indptr[:-1]], index=self.employers, name=column)
+
+    def employer_mean(self, column):
+        sums = np.bincount(self.employer_of, weights=self.values[column], minlength=len(self.employers))
+        return pd.Series(sums / np.diff(self.indptr), index=self.employers, name=column)
+
+    def applicant_mean(self, column):
+        sums = np.bincount(self.indices, weights=self.values[column], minlength=len(self.applicants))
+        return pd.Series(sums / np.diff(self.csc_indptr), index=self.applicants, name=column)
+
+    def matrix(self, column):
+        """
+        Employer x applicant scipy CSR matrix of `column`; repeated bids on the
+        same applicant are summed.
+        """
+        m = sparse.csr_matrix(
+            (self.values[column], self.indices, self.indptr),
+            shape=(len(self.employers), len(self.applicants)),
+            copy=True,
+        )
+        m.sum_duplicates()
+        return m
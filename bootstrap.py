@@ -0,0 +1,158 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from fitting import Engine
+from ols import Clusters, correction, ols, qr_solve
+
+# values of the bootstrap weights, each drawn with equal probability
+wild_weights = {
+    'rademacher': np.array([-1.0, 1.0]),
+    'webb': np.array([-np.sqrt(1.5), -1, -np.sqrt(0.5), np.sqrt(0.5), 1, np.sqrt(1.5)]),
+}
+
+# bound on the number of bootstrap weights drawn at once (replications x clusters)
+chunk_values = 2 ** 22
+
+
+def wild_bootstrap(
+    spec, terms=None, B=99_999, weights='rademacher', restricted=True, alpha=0.05,
+    seed=0, engine=None, processes=None,
+):
+    """
+    Wild cluster bootstrap of spec's `terms` (by default its interaction terms,
+    or all its terms if it has none), with B replications of Rademacher or
+    Webb weights, one per cluster (per row for HC0/HC1 specs).
+
+    Returns, for each term, the coefficient and its analytical standard error,
+    the bootstrap p-value of the symmetric test that it's 0, and the bootstrap
+    confidence interval. With `restricted` (WCR), the bootstrap samples impose
+    the null and the interval is found by inverting the test; otherwise (WCU)
+    they're built from the unrestricted residuals and the interval is
+    percentile-t.
+
+    Every replication is a function of the cluster weights v (B x G) through a
+    few G x G matrices, as in Roodman et al.'s boottest: the bootstrap
+    coefficient's deviation and the cluster scores of the bootstrap residuals
+    (dotted with the term's row of (X'X)^-1) are v a and v * a - v K', for
+    each null value theta a0 - theta a1 and K0 - theta K1. So the replications
+    are matrix products over chunks of at most `chunk_values` weights, and the
+    whole test inversion works from five numbers per replication. With
+    `processes`, the chunks are spread over that many worker processes; the
+    results depend only on `seed`, not on how the chunks are run.
+    """
+    if spec.absorb:
+        raise ValueError('the bootstrap needs the fixed effects as dummies, not absorbed')
+    if spec.cov_type not in ('cluster', 'HC0', 'HC1'):
+        raise ValueError(f'can\'t bootstrap {spec.cov_type} errors')
+    if weights not in wild_weights:
+        raise ValueError(f'unknown weights {weights}')
+    engine = engine or Engine(lean=True)
+    X = engine.design(spec)
+    if terms is None:
+        terms = [t for t in spec.terms if '*' in t] or list(spec.terms)
+    columns = [X.columns.get_loc(t) for t in terms]
+    X = X.to_numpy()
+    y = engine.outcome(spec).to_numpy(dtype=float)
+    n, k = X.shape
+    if spec.cov_type == 'cluster':
+        clusters = engine.clusters(spec)
+    else:
+        clusters = Clusters.from_codes(np.arange(n), n)
+    G = len(clusters)
+    c = correction(spec.cov_type, n, k, G)
+
+    fit = ols(y, X, spec.cov_type, clusters)
+    params, bse = fit._params, np.sqrt(np.diag(fit._cov))
+    bread = np.linalg.inv(X.T @ X)
+
+    kernels = []
+    for j in columns:
+        if restricted:
+            # residuals of y - theta x_j on the other columns are u0 - theta u1
+            others = np.delete(X, j, axis=1)
+            u0 = y - others @ qr_solve(others, y)[0]
+            u1 = X[:, j] - others @ qr_solve(others, X[:, j])[0]
+        else:
+            u0, u1 = y - X @ params, np.zeros(n)
+        r = bread[:, j]
+        W = clusters.sums(X * (X @ r)[:, None]) @ bread
+        kernels.append([])
+        for u in (u0, u1):
+            S = clusters.sums(X * u[:, None])
+            kernels[-1] += [S @ r, W @ S.T]
+
+    size = max(1, chunk_values // G)
+    chunks = [min(size, B - start) for start in range(0, B, size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(chunks))
+    args = [(s, m, G, weights, kernels) for s, m in zip(seeds, chunks)]
+    if processes:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            stats = list(pool.map(replicate, *zip(*args)))
+    else:
+        stats = [replicate(*a) for a in args]
+    stats = np.concatenate(stats, axis=2)
+
+    rows = []
+    for i, j in enumerate(columns):
+        def pvalue(theta):
+            n0, n1, q00, q01, q11 = stats[i]
+            t2 = (n0 - theta * n1) ** 2 / (c * (q00 - 2 * theta * q01 + theta ** 2 * q11))
+            return np.mean(t2 >= ((params[j] - theta) / bse[j]) ** 2)
+
+        rows.append({
+            'coef': params[j],
+            'se': bse[j],
+            't': params[j] / bse[j],
+            'pvalue': pvalue(0),
+            'ci_low': invert(pvalue, params[j], -bse[j], alpha),
+            'ci_high': invert(pvalue, params[j], bse[j], alpha),
+        })
+    return pd.DataFrame(rows, index=pd.Index(terms, name='term'))
+
+
+def replicate(seed, size, n_clusters, weights, kernels):
+    """
+    `size` bootstrap replications: for each term, the coefficient deviations
+    n0 - theta n1 and the sums of squared scores q00 - 2 theta q01 + theta^2 q11,
+    as a (terms, 5, size) array.
+    """
+    v = np.random.default_rng(seed).choice(wild_weights[weights], size=(size, n_clusters))
+    stats = np.empty((len(kernels), 5, size))
+    for i, (a0, K0, a1, K1) in enumerate(kernels):
+        q0 = v * a0 - v @ K0.T
+        q1 = v * a1 - v @ K1.T
+        stats[i] = [
+            v @ a0, v @ a1,
+            np.einsum('ij,ij->i', q0, q0), np.einsum('ij,ij->i', q0, q1), np.einsum('ij,ij->i', q1, q1),
+        ]
+    return stats
+
+
+def invert(pvalue, estimate, step, alpha, tol=1e-8):
+    """
+    The null value, on the side of `estimate` that `step` points to, where
+    pvalue() falls below alpha: stepping out in doubling steps, then bisecting.
+    """
+    inside, outside = estimate, estimate + step
+    while pvalue(outside) >= alpha:
+        inside, outside = outside, outside + 2 * (outside - inside)
+        if not np.isfinite(outside):
+            return outside
+    while abs(outside - inside) > tol * abs(step):
+        mid = (inside + outside) / 2
+        if pvalue(mid) >= alpha:
+            inside = mid
+        else:
+            outside = mid
+    return (inside + outside) / 2
+
+
+def bootstrap_all(specs, **kwargs):
+    """wild_bootstrap() for each spec that it can run on, in one table indexed by (spec, term)."""
+    engine = kwargs.pop('engine', None) or Engine(lean=True)
+    return pd.concat(
+        {name: wild_bootstrap(spec, engine=engine, **kwargs) for name, spec in specs.items() if not spec.absorb},
+        names=['spec'],
+    )
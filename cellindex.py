@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+
+from datasets import filter_rows, load_dataset
+
+# long tables that are indexed by cell, with the columns of the cells: the
+# treatment and the promote type seen (the gender of the employer or guesser
+# is filtered on with a mask, which keeps the rows in order)
+indexed_tables = {
+    'employer_wage_bids': ['treatment', 'promote_type_seen'],
+    'applicant_wage_guesses': ['treatment', 'promote_type_seen'],
+}
+
+
+class CellIndex:
+    """
+    A table sorted by a few low-cardinality columns, with the start and stop
+    rows of each combination (cell) of their values. The rows of a cell are
+    then a contiguous range, which select() returns as a slice of the sorted
+    table (sharing its data) instead of a boolean-masked copy.
+
+    The sort is stable, so within a cell the rows keep their order (grouped
+    by employer or guesser); rows from several cells are put back in the
+    order of the original table.
+    """
+
+    def __init__(self, df, columns):
+        self.columns = list(columns)
+        key = np.zeros(len(df), dtype=np.int64)
+        for c in self.columns:
+            codes, uniques = pd.factorize(df[c], sort=True)
+            key = key * len(uniques) + codes
+        order = np.argsort(key, kind='stable')
+        self.df = df.iloc[order]
+        # the position in the original table of each sorted row
+        self.positions = order
+        key = key[order]
+        starts = np.flatnonzero(np.concatenate([[True], key[1:] != key[:-1]])) if len(key) else np.array([], dtype=int)
+        self.cells = self.df[self.columns].iloc[starts].reset_index(drop=True)
+        self.cells['start'] = starts
+        self.cells['stop'] = np.append(starts[1:], len(key))
+
+    @classmethod
+    def load(cls, name):
+        """The CellIndex of one of the indexed_tables."""
+        return cls(load_dataset(name), indexed_tables[name])
+
+    def __len__(self):
+        return len(self.df)
+
+    def ranges(self, **where):
+        """The (start, stop) row ranges of the cells matching `where`."""
+        cells = filter_rows(self.cells, {c: v for c, v in where.items() if c in self.columns})
+        return list(zip(cells['start'], cells['stop']))
+
+    def select(self, **where):
+        """
+        The rows where each column in `where` equals (or is one of) the given
+        value(s), in their original order, as in load_dataset. When they are a
+        single cell this is a slice of the sorted table; filters on other
+        columns are applied to it as boolean masks.
+        """
+        ranges = self.ranges(**where)
+        if len(ranges) == 1:
+            df = self.df.iloc[slice(*ranges[0])]
+        else:
+            rows = np.concatenate([np.arange(start, stop) for start, stop in ranges] or [np.array([], dtype=int)])
+            df = self.df.iloc[rows[np.argsort(self.positions[rows], kind='stable')]]
+        rest = {c: v for c, v in where.items() if c not in self.columns}
+        return filter_rows(df, rest) if rest else df
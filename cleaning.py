@@ -0,0 +1,262 @@
+import numpy as np
+import pandas as pd
+
+from ragged import RaggedArray
+from schema import applicant_columns, employer_columns, recode_raw
+
+
+def attempt_columns(df):
+    return [x for x in df.columns if 'attempts' in x]
+
+
+def drop_invalid(df, max_attempts=3):
+    """
+    Drop participants who reported gender 'Other' or who needed `max_attempts`
+    or more tries on any understanding question.
+
+    Returns the filtered frame and a dict with the number of rows removed by each
+    rule (rules are applied in order, so a row is only counted once).
+    """
+    rules = {
+        'gender == Other': (df['gender'] != 'Other').to_numpy(),
+        # a missing number of attempts counts as too many
+        f'attempts >= {max_attempts}': (
+            df[attempt_columns(df)] < max_attempts
+        ).fillna(False).all(axis=1).to_numpy(),
+    }
+    keep = np.ones(len(df), dtype=bool)
+    removed = {}
+    for rule, mask in rules.items():
+        removed[rule] = int((keep & ~mask).sum())
+        keep &= mask
+    return df[keep], removed
+
+
+def report_removed(name, removed):
+    print(
+        f'{name}: ' + ', '.join(f'dropped {n} with {rule}' for rule, n in removed.items())
+    )
+
+
+# columns kept in applicant_data_clean / employer_data_clean
+
+applicant_clean_columns = [
+    'treatment',
+    'age',
+    'female',
+    'bachelors_or_higher',
+    'grad_degree',
+    'employed_fulltime',
+    'eval_correct',
+    'noneval_correct',
+    'avatar',
+    'promote1',
+    'promote2',
+    'promote3_attentive',
+    'promote3_boastful',
+    'study_topic_guess',
+    'male_avg_answers_guess',
+    'female_avg_answers_guess',
+    'credibility_of_100',
+    'counterfactual_promote',
+    'self_promote_reason',
+]
+
+employer_clean_columns = [
+    'treatment',
+    'age',
+    'female',
+    'bachelors_or_higher',
+    'grad_degree',
+    'employed_fulltime',
+    'study_topic_guess',
+    'male_avg_answers_guess',
+    'female_avg_answers_guess',
+    'exit_survey_female_avatar',
+    'exit_survey_male_avatar',
+    'exit_survey_perform',
+    'exit_survey_promote',
+    'male_enjoy_agree',
+    'male_respect_agree',
+    'male_approachable_agree',
+    'male_interpersonal_agree',
+    'male_recommend_agree',
+    'male_confident_describe',
+    'female_enjoy_agree',
+    'female_respect_agree',
+    'female_approachable_agree',
+    'female_interpersonal_agree',
+    'female_recommend_agree',
+    'female_confident_describe',
+]
+
+
+def recode_applicants(df_app):
+    """Derive the analysis fields of the applicant data from a (schema-read) raw export."""
+    df_app = recode_raw(df_app.copy(), applicant_columns)
+
+    df_app['treatment'] = df_app['treatment'] + 1
+
+    df_app['female'] = (df_app['gender'] == 'Female').astype('int8')
+
+    df_app['avatar'] = df_app['avatar'].str.rstrip('.jpg')
+
+    df_app['bachelors_or_higher'] = df_app['education'].isin(
+        ["Bachelor's Degree", "Master's Degree", "Ph.D. or higher"]
+    ).astype('int8')
+
+    df_app['grad_degree'] = df_app['education'].isin(
+        ["Master's Degree", "Ph.D. or higher"]
+    ).astype('int8')
+
+    df_app['employed_fulltime'] = df_app['employed'] == 'Employed full-time'
+
+    df_app = df_app.rename(
+        columns = {
+            'self_eval': 'promote1',
+            'self_eval_agree': 'promote2',
+            'self_eval_statement': 'promote3',
+        }
+    )
+
+    df_app['promote3_attentive'] = (df_app['promote3'] == 1).astype('int8')
+    df_app['promote3_boastful'] = (df_app['promote3'] == 2).astype('int8')
+
+    return df_app
+
+
+def recode_employers(df_emp):
+    """Derive the analysis fields of the employer data from a (schema-read) raw export."""
+    df_emp = recode_raw(df_emp.copy(), employer_columns)
+
+    df_emp['female'] = (df_emp['gender'] == 'Female').astype('int8')
+
+    df_emp['bachelors_or_higher'] = df_emp['education'].isin(
+        ["Bachelor's Degree", "Master's Degree", "Ph.D. or higher"]
+    ).astype('int8')
+
+    df_emp['grad_degree'] = df_emp['education'].isin(
+        ["Master's Degree", "Ph.D. or higher"]
+    ).astype('int8')
+
+    df_emp['employed_fulltime'] = (df_emp['employed'] == 'Employed full-time').astype('int8')
+
+    return df_emp
+
+
+def parse_lists(df, dtypes):
+    """Parse the dash-delimited list columns of df, given as {column: dtype}."""
+    return {c: RaggedArray.from_dashed(df[c], dtype) for c, dtype in dtypes.items()}
+
+
+def explode_lockstep(lists, truncate_to, fill=np.nan):
+    """
+    Explode parsed list columns (RaggedArrays with one row per participant) in
+    lockstep.
+
+    Returns the row number and position within the list of each element, plus a
+    dict of flat arrays, one per column. Lists are cut to the shortest of the
+    `truncate_to` columns, the way zip does; positions past the end of the other
+    (e.g. optional, missing) lists come out as `fill`, or raise an IndexError
+    if `fill` is None.
+    """
+    n = np.min([lists[c].lengths for c in truncate_to], axis=0)
+    index = RaggedArray.from_lengths(np.arange(n.sum()), n)
+    row, position = index.row_ids(), index.positions()
+    flat = {
+        c: ra.take(row, position, None if c in truncate_to else fill)
+        for c, ra in lists.items()
+    }
+    return row, position, flat
+
+
+def build_bids(df_emp, df_app):
+    """
+    Long frame of employer wage bids, one row per bid, indexed by employer.
+
+    Bids on applicants that are not in df_app (i.e. were discarded) are dropped.
+    """
+    lists = parse_lists(df_emp, {
+        'applicants': str,
+        'bids': float,
+        'perform_guesses': int,
+        'soc_approp_ratings': int,
+    })
+    row, j, flat = explode_lockstep(lists, truncate_to=['applicants', 'bids'], fill=None)
+    # hash join against the applicant index; -1 means the applicant was discarded
+    app_row = df_app.index.get_indexer(flat['applicants'])
+    keep = app_row >= 0
+    row, j, app_row = row[keep], j[keep], app_row[keep]
+
+    def app_field(field):
+        return df_app[field].to_numpy()[app_row]
+
+    emp_is_female = (df_emp['gender'].to_numpy() == 'Female').astype(int)
+
+    return pd.DataFrame({
+        'employer': df_emp.index.to_numpy()[row],
+        'applicant': flat['applicants'][keep],
+        'treatment': app_field('treatment'),
+        'emp_is_female': emp_is_female[row],
+        'app_is_female': app_field('female'),
+        'promote_type_seen': np.where(j < 10, 1, np.where(j < 20, 2, 3)),
+        'app_promote1': app_field('promote1'),
+        'app_promote2': app_field('promote2'),
+        'app_promote3_attentive': app_field('promote3_attentive'),
+        'app_promote3_boastful': app_field('promote3_boastful'),
+        'app_eval_correct': app_field('eval_correct'),
+        'bid': flat['bids'][keep],
+        'perform_guess': flat['perform_guesses'][keep],
+        'approp_rating': flat['soc_approp_ratings'][keep] + 1,
+    }).set_index('employer')
+
+
+def build_guesses(df_app, float_optional=False):
+    """
+    Long frame of applicant wage guesses, one row per guess, indexed by guesser.
+
+    perform_guess and approp_guess are NaN for applicants who were not asked to
+    make them. The columns stay integer when nobody was skipped, unless
+    `float_optional` is set (so that chunks written separately are formatted
+    the same way).
+    """
+    lists = parse_lists(df_app, {
+        'wage_guess_perform': int,
+        'wage_guess_promote_type': int,
+        'wage_guess_promote1': int,
+        'wage_guess_promote2': int,
+        'wage_guess_promote3': int,
+        'wage_guess_gender': str,
+        'wage_guess_other': float,
+        'perform_guess_other': int,
+        'approp_guess_other': int,
+    })
+    # the optional perform/approp guesses come out as NaN where missing
+    row, _, flat = explode_lockstep(
+        lists, truncate_to=[c for c in lists if not c.endswith('_guess_other')]
+    )
+
+    def optional_int(values, offset=0):
+        values = values + offset
+        if float_optional or np.isnan(values).any():
+            return values
+        return values.astype(int)
+
+    guesser_is_female = (df_app['gender'].to_numpy() == 'Female').astype(int)
+    promote3 = flat['wage_guess_promote3'] + 1
+
+    return pd.DataFrame({
+        'guesser': df_app.index.to_numpy()[row],
+        'treatment': df_app['treatment'].to_numpy()[row],
+        'guesser_is_female': guesser_is_female[row],
+        'other_is_female': (flat['wage_guess_gender'] == 'Female').astype(int),
+        'promote_type_seen': flat['wage_guess_promote_type'] + 1,
+        'other_promote1': flat['wage_guess_promote1'] + 1,
+        'other_promote2': flat['wage_guess_promote2'],
+        'other_promote3_attentive': (promote3 == 1).astype(int),
+        'other_promote3_boastful': (promote3 == 2).astype(int),
+        'other_eval_correct': flat['wage_guess_perform'],
+        'wage_guess': flat['wage_guess_other'],
+        'perform_guess': optional_int(flat['perform_guess_other']),
+        'approp_guess': optional_int(flat['approp_guess_other'], 1),
+    }).set_index('guesser')
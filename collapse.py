@@ -0,0 +1,110 @@
+import numpy as np
+import pandas as pd
+
+from ols import AggregateResult, Clusters, correction, cov_types, qr_solve
+
+
+class Cells:
+    """
+    Rows collapsed to their unique (cluster, regressors) cells, keeping the
+    number of rows and the sums of y and y^2 in each cell. When every regressor
+    is discrete (promote ratings, gender, treatment and eval_correct dummies),
+    this is a few cells per cluster however many rows there are, and it holds
+    everything an OLS fit with cluster-robust or HC0-HC3 errors needs.
+    """
+
+    def __init__(self, y, X, groups=None, keys=None):
+        """
+        `keys` are optional columns (one row per row of X) that determine the
+        rows of X, e.g. the raw variables that the terms and dummies are built
+        from; it's quicker to find the cells from those than from X itself.
+        """
+        self.names = list(X.columns) if isinstance(X, pd.DataFrame) else [f'x{i}' for i in range(X.shape[1])]
+        X = np.asarray(X, dtype=float)
+        y = np.asarray(y, dtype=float)
+        clusters = None
+        if groups is not None:
+            clusters = groups if isinstance(groups, Clusters) else Clusters(groups)
+
+        cell = cell_codes(
+            X if keys is None else np.asarray(keys),
+            None if clusters is None else clusters.codes,
+        )
+        n_cells = cell.max(initial=-1) + 1
+        # cells are numbered in order of appearance, so a row starts a new
+        # cell when its code is higher than all the ones before it
+        seen = np.maximum.accumulate(np.concatenate([[-1], cell[:-1]]))
+        first = np.flatnonzero(cell > seen)
+
+        self.X = X[first]
+        self.counts = np.bincount(cell, minlength=n_cells).astype(float)
+        self.sum_y = np.bincount(cell, weights=y, minlength=n_cells)
+        self.sum_y2 = np.bincount(cell, weights=y * y, minlength=n_cells)
+        self.nobs = len(y)
+        self.clusters = None
+        if clusters is not None:
+            self.clusters = Clusters.from_codes(clusters.codes[first], len(clusters))
+
+    def __len__(self):
+        return len(self.counts)
+
+
+def cell_codes(keys, cluster_codes=None):
+    """
+    Code each row by its (cluster, keys row) combination, numbered in order of
+    first appearance. Columns are factorized and combined into one integer key,
+    falling back to sorting the rows if the key could overflow.
+    """
+    columns = [keys[:, j] for j in range(keys.shape[1])]
+    if cluster_codes is not None:
+        columns = [cluster_codes, *columns]
+    key = np.zeros(len(keys), dtype=np.int64)
+    size = 1
+    for col in columns:
+        codes, uniques = pd.factorize(col)
+        size *= len(uniques)
+        if size >= 2 ** 62:
+            _, inverse = np.unique(np.column_stack(columns), axis=0, return_inverse=True)
+            key = inverse.ravel()
+            break
+        key = key * len(uniques) + codes
+    return pd.factorize(key)[0]
+
+
+def ols_cells(cells, cov_type='HC1'):
+    """
+    OLS on collapsed Cells, by least squares weighted by the cell counts.
+    The coefficients and the cluster-robust or HC0-HC3 variance are exactly
+    those of the OLS on the rows: within a cell, the residuals' sum and sum
+    of squares follow from the sums of y and y^2.
+    """
+    if cov_type not in cov_types:
+        raise ValueError(f'unknown cov_type {cov_type}')
+    w = np.sqrt(cells.counts)
+    params, R_inv = qr_solve(cells.X * w[:, None], cells.sum_y / w)
+    fitted = cells.X @ params
+    # sum of the residuals, and of their squares, in each cell
+    sum_e = cells.sum_y - cells.counts * fitted
+    sum_e2 = cells.sum_y2 - 2 * fitted * cells.sum_y + cells.counts * fitted ** 2
+
+    n, k = cells.nobs, cells.X.shape[1]
+    n_groups = None
+    if cov_type == 'cluster':
+        n_groups = len(cells.clusters)
+        scores = cells.clusters.sums(cells.X * sum_e[:, None])
+        meat = scores.T @ scores
+    else:
+        weights = sum_e2
+        if cov_type in ('HC2', 'HC3'):
+            Q = cells.X @ R_inv
+            leverage = np.einsum('ij,ij->i', Q, Q)
+            weights = weights / (1 - leverage) ** (1 if cov_type == 'HC2' else 2)
+        meat = (cells.X * weights[:, None]).T @ cells.X
+
+    bread = R_inv @ R_inv.T
+    cov = correction(cov_type, n, k, n_groups) * bread @ meat @ bread
+    total = cells.sum_y.sum()
+    return AggregateResult(
+        params, cov, cells.names, cov_type, n_groups, n,
+        ssr=sum_e2.sum(), centered_tss=cells.sum_y2.sum() - total * total / n,
+    )
@@ -0,0 +1,120 @@
+import json
+import os
+import shutil
+import uuid
+
+import pandas as pd
+
+# cleaned long tables that are also written as partitioned parquet datasets,
+# with the column they're indexed by and the columns they're partitioned on
+partitioned_tables = {
+    'employer_wage_bids': ('employer', ['treatment', 'promote_type_seen']),
+    'applicant_wage_guesses': ('guesser', ['treatment', 'promote_type_seen']),
+}
+
+# cleaned wide tables, which are only written as csv, with their index column
+csv_tables = {
+    'applicant_data_clean': 'applicant',
+    'employer_data_clean': 'employer',
+}
+
+
+def parquet_available():
+    try:
+        import pyarrow.dataset  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def compact(df):
+    """Downcast integer columns to the smallest type that holds them."""
+    df = df.copy()
+    for c in df.columns:
+        if pd.api.types.is_integer_dtype(df[c]):
+            df[c] = pd.to_numeric(df[c], downcast='integer')
+    return df
+
+
+def partitioning(name):
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    _, partition_cols = partitioned_tables[name]
+    return ds.partitioning(
+        pa.schema([(c, pa.int8()) for c in partition_cols]), flavor='hive'
+    )
+
+
+def write_partitioned(df, name, append=False):
+    """
+    Write one of the partitioned_tables to the parquet dataset `name`/, with
+    one directory per partition (e.g. treatment=1/promote_type_seen=2/).
+
+    With `append`, adds new files to an existing dataset instead of replacing it.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    _, partition_cols = partitioned_tables[name]
+    if not append and os.path.exists(name):
+        shutil.rmtree(name)
+    df = compact(df.reset_index())
+    basename = f'part-{uuid.uuid4().hex}.parquet'
+    for keys, part in df.groupby(partition_cols, sort=True):
+        path = os.path.join(name, *(f'{c}={k}' for c, k in zip(partition_cols, keys)))
+        os.makedirs(path, exist_ok=True)
+        table = pa.Table.from_pandas(part.drop(columns=partition_cols), preserve_index=False)
+        # remember where the partition columns go, to restore the column order
+        table = table.replace_schema_metadata({
+            **table.schema.metadata, b'columns': json.dumps(list(df.columns))
+        })
+        pq.write_table(table, os.path.join(path, basename))
+
+
+def load_dataset(name, columns=None, **where):
+    """
+    Load a cleaned table, keeping only the rows where each column in `where`
+    equals the given value (or is one of the given values, for a list).
+
+    Reads from the partitioned parquet dataset when there is one, so that only
+    the matching partitions and the requested `columns` are read (other
+    conditions are pushed down to the parquet reader); otherwise falls back to
+    reading and filtering the csv.
+    """
+    if name in csv_tables:
+        index_col = csv_tables[name]
+    else:
+        index_col, _ = partitioned_tables[name]
+    if columns is not None:
+        columns = [index_col] + [c for c in columns if c != index_col]
+
+    if os.path.isdir(name) and parquet_available():
+        import pyarrow.dataset as ds
+
+        condition = None
+        for c, v in where.items():
+            cond = ds.field(c).isin(v) if isinstance(v, (list, tuple)) else ds.field(c) == v
+            condition = cond if condition is None else condition & cond
+        table = ds.dataset(
+            name, format='parquet', partitioning=partitioning(name)
+        ).to_table(columns=columns, filter=condition)
+        # partition columns come back last; restore the original column order
+        if columns is None:
+            columns = json.loads(table.schema.metadata[b'columns'])
+        table = table.select([c for c in columns if c in table.column_names])
+        return table.to_pandas().set_index(index_col)
+
+    # the columns filtered on are read too, and dropped once the rows are filtered
+    usecols = None if columns is None else columns + [c for c in where if c not in columns]
+    df = filter_rows(pd.read_csv(f'{name}.csv', usecols=usecols), where)
+    if columns is not None:
+        df = df[columns]
+    return df.set_index(index_col)
+
+
+def filter_rows(df, where):
+    """The rows of df where each column in `where` equals (or is one of) the given value(s)."""
+    for c, v in where.items():
+        df = df[df[c].isin(v) if isinstance(v, (list, tuple)) else df[c] == v]
+    return df
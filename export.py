@@ -0,0 +1,60 @@
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+import pandas as pd
+
+from datasets import partitioned_tables, write_partitioned
+
+
+def latin1_safe(df):
+    """
+    Replace characters that can't be encoded in latin-1 (which Stata needs) with
+    their \\N{...} names. Only object columns are touched.
+    """
+    df = df.copy()
+    for c in df.columns[df.dtypes == object]:
+        col = df[c]
+        if pd.api.types.infer_dtype(col, skipna=True) == 'string':
+            df[c] = col.str.encode('latin-1', 'namereplace').str.decode('latin-1')
+        else:
+            # mixed column; leave the non-strings alone
+            df[c] = col.map(
+                lambda x: x if not isinstance(x, str) else x.encode('latin-1', 'namereplace').decode('latin-1')
+            )
+    return df
+
+
+def write_file(df, path, kwargs):
+    """
+    Write df to `path`, as csv or Stata depending on its extension, or as one of
+    the partitioned parquet datasets. Returns the path and the time taken.
+    """
+    start = time.perf_counter()
+    if path.endswith('.csv'):
+        df.to_csv(path, **kwargs)
+    elif path.endswith('.dta'):
+        latin1_safe(df).to_stata(path, **kwargs)
+    elif path in partitioned_tables:
+        write_partitioned(df, path, **kwargs)
+    else:
+        raise ValueError(f'don\'t know how to write {path}')
+    return path, time.perf_counter() - start
+
+
+def export_all(exports, processes=False, max_workers=None):
+    """
+    Run the (df, path, kwargs) `exports` concurrently, on a thread pool,
+    printing the time each write took.
+
+    With `processes`, uses a process pool instead, which pickles each df to its
+    worker and, where processes are spawned rather than forked (macOS, Windows),
+    has to be called from under an `if __name__ == '__main__':` guard.
+    """
+    executor = ProcessPoolExecutor if processes else ThreadPoolExecutor
+    start = time.perf_counter()
+    with executor(max_workers=max_workers or len(exports)) as pool:
+        futures = [pool.submit(write_file, df, path, kwargs) for df, path, kwargs in exports]
+        for future in as_completed(futures):
+            path, seconds = future.result()
+            print(f'wrote {path} in {seconds:.2f}s')
+    print(f'exported {len(exports)} files in {time.perf_counter() - start:.2f}s')
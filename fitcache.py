@@ -0,0 +1,108 @@
+import hashlib
+import json
+import os
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from ols import AggregateResult
+
+# changed whenever what's stored (or how it's fitted) changes, so that old entries are missed
+version = 2
+
+
+class FitCache:
+    """
+    Fitted models kept on disk, so that a spec that has already been fitted on
+    the same data (by this script or another) isn't fitted again.
+
+    Entries are content-addressed: the key is a hash of the rows of the columns
+    the spec uses and of the spec's definition (not its title), so a change to
+    either is a miss rather than a stale hit. Each entry is a small .npz of the
+    coefficients, the covariance matrix and the numbers needed for the degrees
+    of freedom and R^2, and comes back as an AggregateResult. When the entries
+    take more than `max_bytes`, the least recently used are removed.
+
+    Fits are stored for y as it is in the data, and scaled by the spec's
+    y_scale on the way in and out, so that e.g. bids in dollars (regressions.py)
+    and in cents (presentation_tables.py) share an entry.
+    """
+
+    def __init__(self, path='fit_cache', max_bytes=64 * 2 ** 20):
+        self.path = path
+        self.max_bytes = max_bytes
+
+    def key(self, spec, data, columns):
+        """The key of spec fitted on `columns` of its subset `data`."""
+        h = hashlib.sha256(json.dumps([
+            version, spec.dataset, spec.y, spec.terms, sorted((spec.where or {}).items()),
+            spec.fe, spec.absorb, spec.cov_type, columns,
+        ]).encode())
+        h.update(pd.util.hash_pandas_object(data.index, index=False).to_numpy().tobytes())
+        h.update(np.ascontiguousarray(data[columns].to_numpy(dtype=float)).tobytes())
+        return h.hexdigest()
+
+    def file(self, key):
+        return os.path.join(self.path, f'{key}.npz')
+
+    def get(self, key, y_scale=1):
+        """The fit stored under `key`, for y multiplied by `y_scale`, or None."""
+        try:
+            with np.load(self.file(key)) as stored:
+                params, cov = stored['params'], stored['cov']
+                meta = json.loads(str(stored['meta']))
+            # mark as recently used
+            os.utime(self.file(key))
+        except FileNotFoundError:
+            return None
+        meta['ssr'] *= y_scale ** 2
+        meta['centered_tss'] *= y_scale ** 2
+        return AggregateResult(params * y_scale, cov * y_scale ** 2, **meta)
+
+    def put(self, key, fit, y_scale=1):
+        """
+        Store a fit (an OLSResult or a statsmodels result) of y multiplied by
+        `y_scale`. The file is written under a temporary name and then
+        renamed, so that several processes can share the cache.
+        """
+        names = list(fit.model.exog_names) if hasattr(fit, 'model') else list(fit.names)
+        meta = {
+            'names': names,
+            'cov_type': fit.cov_type,
+            'n_groups': None if getattr(fit, 'n_groups', None) is None else int(fit.n_groups),
+            'nobs': int(fit.nobs),
+            'ssr': float(fit.ssr) / y_scale ** 2,
+            'centered_tss': float(fit.centered_tss) / y_scale ** 2,
+            'df_absorbed': int(getattr(fit, 'df_absorbed', 0)),
+        }
+        os.makedirs(self.path, exist_ok=True)
+        temporary = os.path.join(self.path, f'.{uuid.uuid4().hex}.npz')
+        np.savez(
+            temporary,
+            params=np.asarray(fit.params, dtype=float) / y_scale,
+            cov=np.asarray(fit.cov_params(), dtype=float) / y_scale ** 2,
+            meta=np.array(json.dumps(meta)),
+        )
+        os.replace(temporary, self.file(key))
+        self.evict()
+
+    def evict(self):
+        """Remove the least recently used entries until they fit in max_bytes."""
+        entries = []
+        for entry in os.scandir(self.path):
+            if entry.name.endswith('.npz') and not entry.name.startswith('.'):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
@@ -0,0 +1,234 @@
+import numpy as np
+import pandas as pd
+import statsmodels.api as sm
+
+from absorb import Absorbed
+from cellindex import CellIndex, indexed_tables
+from collapse import Cells, ols_cells
+from datasets import filter_rows, load_dataset
+from ols import Clusters, ols_outcomes
+from specs import indicators
+
+
+def subset_key(spec):
+    """Hashable key for the rows a spec is fitted on."""
+    where = spec.where or {}
+    return spec.dataset, tuple(
+        (c, tuple(v) if isinstance(v, (list, tuple)) else v) for c, v in sorted(where.items())
+    )
+
+
+def spec_columns(spec):
+    """The columns of spec's dataset that fitting it reads."""
+    columns = {indicators.get(f, (f,))[0] for t in spec.terms for f in t.split('*')}
+    return columns | set(spec.fe) | set(spec.absorb) | set(spec.where or {}) | {spec.y}
+
+
+def design_key(spec):
+    """Hashable key for spec's design matrix (and covariance), which specs differing only in y share."""
+    return subset_key(spec), spec.terms, spec.fe, spec.absorb, spec.cov_type
+
+
+def spec_key(spec):
+    """Hashable key for a whole spec."""
+    return design_key(spec), spec.y, spec.y_scale
+
+
+class Engine:
+    """
+    Fits Specs (see specs.py), loading each filtered subset of the data once and
+    building each regressor column once per subset, however many specs use them.
+
+    With `lean`, fits with the NumPy kernel in ols.py instead of statsmodels;
+    the results have the coefficients and standard errors but no summary().
+    With `collapse`, the rows are first collapsed to their unique regressor
+    cells within each cluster (see collapse.py), which gives the same results
+    from far fewer rows when all the regressors are discrete.
+
+    Fits are kept, so asking for the same spec again costs nothing. Lean fits
+    (and fits absorbing fixed effects) of specs with the same design matrix
+    and different outcomes, when fitted together with fit_all, are solved
+    against one factorization of it.
+
+    With a FitCache (see fitcache.py) as `cache`, fits are also stored on disk,
+    and lean or collapsed engines (whose results needn't have a summary())
+    take fits from it instead of refitting.
+    """
+
+    def __init__(self, lean=False, collapse=False, tables=None, cache=None):
+        self.lean = lean
+        self.collapse = collapse
+        self.tables = tables or {}
+        self.cache = cache
+        self.indexes = {}
+        self.subsets = {}
+        self.columns = {}
+        self.fits = {}
+
+    def data(self, spec):
+        """
+        Spec's subset of its dataset: filtered from the in-memory DataFrame
+        given for the dataset in `tables`, sliced from its CellIndex for the
+        bids and guesses, or otherwise read with load_dataset.
+        """
+        key = subset_key(spec)
+        if key not in self.subsets:
+            if spec.dataset in self.tables:
+                self.subsets[key] = filter_rows(self.tables[spec.dataset], spec.where or {})
+            elif spec.dataset in indexed_tables:
+                self.subsets[key] = self.index(spec.dataset).select(**(spec.where or {}))
+            else:
+                self.subsets[key] = load_dataset(spec.dataset, **(spec.where or {}))
+        return self.subsets[key]
+
+    def index(self, dataset):
+        """The CellIndex of one of the indexed_tables, loaded once."""
+        if dataset not in self.indexes:
+            self.indexes[dataset] = CellIndex.load(dataset)
+        return self.indexes[dataset]
+
+    def column(self, spec, name):
+        """The regressor `name` ('a', 'a*b' or an indicator) on spec's subset."""
+        key = subset_key(spec), name
+        if key not in self.columns:
+            data = self.data(spec)
+            if '*' in name:
+                a, b = name.split('*', 1)
+                col = self.column(spec, a) * self.column(spec, b)
+            elif name in indicators:
+                c, v = indicators[name]
+                col = (data[c] == v).to_numpy(dtype=float)
+            else:
+                col = data[name].to_numpy(dtype=float)
+            self.columns[key] = col
+        return self.columns[key]
+
+    def dummies(self, spec, factor):
+        """Dummies for all but the last level of `factor` on spec's subset."""
+        key = subset_key(spec), ('fe', factor)
+        if key not in self.columns:
+            self.columns[key] = pd.get_dummies(self.data(spec)[factor]).to_numpy(dtype=float)[:, :-1]
+        return self.columns[key]
+
+    def clusters(self, spec):
+        """The clusters (the index: employer, guesser or applicant) of spec's subset."""
+        key = subset_key(spec), 'clusters'
+        if key not in self.columns:
+            self.columns[key] = Clusters(self.data(spec).index)
+        return self.columns[key]
+
+    def absorbed(self, spec):
+        """The fixed effects that spec absorbs, on its subset."""
+        key = subset_key(spec), ('absorb', spec.absorb)
+        if key not in self.columns:
+            data = self.data(spec)
+            self.columns[key] = Absorbed([
+                self.clusters(spec) if f == data.index.name else Clusters(data[f])
+                for f in spec.absorb
+            ])
+        return self.columns[key]
+
+    def keys(self, spec):
+        """The raw columns that spec's design matrix is built from."""
+        columns = {indicators.get(f, (f,))[0] for t in spec.terms for f in t.split('*')}
+        return self.data(spec)[sorted(columns | set(spec.fe))]
+
+    def design(self, spec):
+        """
+        The design matrix of spec, as a DataFrame with named columns; demeaned
+        and without a constant when spec absorbs fixed effects.
+        """
+        data = self.data(spec)
+        parts = [] if spec.absorb else [np.ones((len(data), 1))]
+        parts += [self.column(spec, t)[:, None] for t in spec.terms]
+        parts += [self.dummies(spec, f) for f in spec.fe]
+        X = np.concatenate(parts, axis=1)
+        names = [] if spec.absorb else ['const']
+        names += list(spec.terms)
+        names += [f'fe{i}' for i in range(X.shape[1] - len(names))]
+        if spec.absorb:
+            X = self.absorbed(spec).demean(X)
+        return pd.DataFrame(X, columns=names, index=data.index)
+
+    def outcome(self, spec):
+        data = self.data(spec)
+        return data[spec.y] if spec.y_scale == 1 else data[spec.y] * spec.y_scale
+
+    def fit(self, spec):
+        """
+        Fit spec with statsmodels, or with the kernel in ols.py if the engine is
+        lean or the spec absorbs fixed effects (which statsmodels can't correct
+        the degrees of freedom for).
+        """
+        key = spec_key(spec)
+        if key not in self.fits:
+            fit = self.cached(spec)
+            if fit is None:
+                fit = self._fit(spec)
+                self.store(spec, fit)
+            self.fits[key] = fit
+        return self.fits[key]
+
+    def cache_key(self, spec):
+        data = self.data(spec)
+        return self.cache.key(spec, data, sorted(spec_columns(spec) - {data.index.name}))
+
+    def cached(self, spec):
+        """Spec's fit from the cache, if the engine can use it and it's there."""
+        if self.cache is None or not (self.lean or self.collapse):
+            return None
+        return self.cache.get(self.cache_key(spec), spec.y_scale)
+
+    def store(self, spec, fit):
+        if self.cache is not None:
+            self.cache.put(self.cache_key(spec), fit, spec.y_scale)
+
+    def _fit(self, spec):
+        data = self.data(spec)
+        y = self.outcome(spec)
+        X = self.design(spec)
+        if self.collapse and not spec.absorb:
+            groups = self.clusters(spec) if spec.cov_type == 'cluster' else None
+            return ols_cells(Cells(y, X, groups, keys=self.keys(spec)), spec.cov_type)
+        if self.lean or spec.absorb:
+            return self.fit_outcomes([spec])[0]
+        if spec.cov_type == 'cluster':
+            return sm.OLS(y, X).fit(cov_type='cluster', cov_kwds={'groups': data.index})
+        return sm.OLS(y, X).fit(cov_type=spec.cov_type)
+
+    def fit_outcomes(self, specs):
+        """
+        Fit specs that share a design matrix (see design_key) with the kernel
+        in ols.py, solving for all their outcomes at once.
+        """
+        spec = specs[0]
+        X = self.design(spec)
+        Y = np.column_stack([self.outcome(s).to_numpy(dtype=float) for s in specs])
+        groups = self.clusters(spec) if spec.cov_type == 'cluster' else None
+        df_absorbed = 0
+        if spec.absorb:
+            absorbed = self.absorbed(spec)
+            Y = absorbed.demean(Y)
+            df_absorbed = absorbed.df(groups)
+        return ols_outcomes(Y, X, spec.cov_type, groups, df_absorbed)
+
+    def fit_all(self, specs):
+        """
+        Fit a dict of specs, returning a dict of fitted models with the same keys.
+        Specs that can share a factorization are fitted together.
+        """
+        batches = {}
+        for spec in specs.values():
+            key = spec_key(spec)
+            if key in self.fits:
+                continue
+            fit = self.cached(spec)
+            if fit is not None:
+                self.fits[key] = fit
+            elif spec.absorb or (self.lean and not self.collapse):
+                batches.setdefault(design_key(spec), {})[key] = spec
+        for batch in batches.values():
+            for (key, spec), fit in zip(batch.items(), self.fit_outcomes(list(batch.values()))):
+                self.fits[key] = fit
+                self.store(spec, fit)
+        return {name: self.fit(spec) for name, spec in specs.items()}
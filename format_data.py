@@ -1,202 +1,91 @@
 # %%
-import pandas as pd
+import argparse
+
+from bidgraph import BidGraph
+from cleaning import (
+    applicant_clean_columns,
+    employer_clean_columns,
+    build_bids,
+    build_guesses,
+    drop_invalid,
+    recode_applicants,
+    recode_employers,
+    report_removed,
+)
+from schema import (
+    applicant_columns,
+    employer_columns,
+    read_raw,
+    self_eval_key,
+    credibility_key,
+    agree_ratings_key,
+    confident_ratings_key,
+)
+from datasets import parquet_available
+from export import export_all
+from incremental import clean_incremental
+from streaming import clean_in_chunks
 
 # %%
-df_app = pd.read_csv('applicant_data.csv', index_col=0)
-df_emp = pd.read_csv('employer_data.csv', index_col=0)
+# `python format_data.py --chunksize N` cleans the exports N rows at a time
+# instead of loading them whole, for exports too large to fit in memory;
+# `python format_data.py --incremental` only cleans participants that are new
+# since the last --incremental run, and appends them to the outputs
+# (both of these only write the csv and parquet outputs)
+parser = argparse.ArgumentParser()
+mode = parser.add_mutually_exclusive_group()
+mode.add_argument('--chunksize', type=int)
+mode.add_argument('--incremental', action='store_true')
+parser.add_argument('--state', default='format_data_state.json')
+args, _ = parser.parse_known_args()
+
+if args.chunksize is not None:
+    clean_in_chunks(args.chunksize)
+    raise SystemExit
+
+if args.incremental:
+    clean_incremental(args.state)
+    raise SystemExit
 
 # %%
-# drop invalid data
-
-# drop data with gender == Other
-df_app = df_app[df_app['gender'] != 'Other']
-df_emp = df_emp[df_emp['gender'] != 'Other']
-
-# drop data with too many understanding attempts
-def valid(row):
-    return all(row[x] < 3 for x in row.index if 'attempts' in x)
-
-df_app = df_app[[valid(row) for _, row in df_app.iterrows()]]
-df_emp = df_emp[[valid(row) for _, row in df_emp.iterrows()]]
+df_app = read_raw('applicant_data.csv', applicant_columns)
+df_emp = read_raw('employer_data.csv', employer_columns)
 
 # %%
-# convert applicant data to form where it can be analyzed easily
-
-self_eval_ratings = {
-    'terrible': 1,
-    'not good': 2,
-    'neutral': 3,
-    'good': 4,
-    'very good': 5,
-    'exceptional': 6
-}
-self_eval_key = {v: k for k, v in self_eval_ratings.items()}
-
-credibility_ratings = {
-    'not credible': 1,
-    'somewhat not credible': 2,
-    'somewhat credible': 3,
-    'credible': 4,
-}
-credibility_key = {v: k for k, v in credibility_ratings.items()}
-
-self_eval_statement = {
-    '“I conduct all tasks assigned to me with the needed attention, and therefore I would work hard in a job that required me to perform well in tasks similar to the application questions.”': 1,
-    '“Usually I am the best at what I do, and therefore I would succeed in a job that required me to perform well in tasks similar to the application questions.”': 2,
-    'I prefer not to include either of these statements in my application.': 3,
-}
-
-df_app['treatment'] = df_app['treatment'].map(lambda x: x + 1).astype(int)
-
-df_app['self_eval'] = df_app['self_eval'].apply(
-    lambda x: self_eval_ratings[x]
-)
-df_app['self_eval_statement'] = df_app['self_eval_statement'].apply(
-    lambda x: self_eval_statement[x]
-)
-
-df_app['credibility_of_100'] = df_app['credibility_of_100'].map(
-    lambda x: credibility_ratings[x]
-)
-
-df_app['counterfactual_promote'] = df_app['counterfactual_promote'].map(
-    lambda x: self_eval_ratings[x]
-)
-
-df_app['female'] = (df_app['gender'] == 'Female').astype(int)
-
-df_app['avatar'] = df_app['avatar'].map(lambda x: x.rstrip('.jpg'))
-
-df_app['bachelors_or_higher'] = df_app['education'].map(
-    lambda x: x in ["Bachelor's Degree", "Master's Degree", "Ph.D. or higher"]
-).astype(int)
-
-df_app['grad_degree'] = df_app['education'].map(
-    lambda x: x in ["Master's Degree", "Ph.D. or higher"]
-).astype(int)
-
-df_app['employed_fulltime'] = df_app['employed'].map(
-    lambda x: x == 'Employed full-time'
-)
-
-def set_as_int(field):
-    df_app[field] = df_app[field].astype(int)
-
-for field in [
-    'self_eval_agree',
-    'age',
-    'eval_correct',
-    'noneval_correct',
-]:
-    set_as_int(field)
-
-df_app.rename(
-    columns = {
-        'self_eval': 'promote1',
-        'self_eval_agree': 'promote2',
-        'self_eval_statement': 'promote3',
-    },
-    inplace = True
-)
+# drop invalid data
+# (data with gender == Other, or with too many understanding attempts)
 
-df_app['promote3_attentive'] = (df_app['promote3'] == 1).astype(int)
-df_app['promote3_boastful'] = (df_app['promote3'] == 2).astype(int)
+df_app, removed = drop_invalid(df_app)
+report_removed('applicants', removed)
+df_emp, removed = drop_invalid(df_emp)
+report_removed('employers', removed)
 
 # %%
-# convert employer data to form where it can be analyzed easily
-
-agree_ratings = {
-    'na': 0,
-    'disagree strongly': 1,
-    'disagree': 2,
-    'agree': 3,
-    'strongly agree': 4,
-}
-agree_ratings_key = {v: k for k, v in agree_ratings.items()}
-
-confident_ratings = {
-    'na': 0,
-    'not confident': 1,
-    'somewhat confident': 2,
-    'appropriately confident': 3,
-    'overly confident': 4,
-}
-confident_ratings_key = {v: k for k, v in confident_ratings.items()}
-
-df_emp['female'] = (df_emp['gender'] == 'Female').astype(int)
-
-df_emp['age'] = df_emp['age'].astype(int)
-
-df_emp['bachelors_or_higher'] = df_emp['education'].map(
-    lambda x: x in ["Bachelor's Degree", "Master's Degree", "Ph.D. or higher"]
-).astype(int)
-
-df_emp['grad_degree'] = df_emp['education'].map(
-    lambda x: x in ["Master's Degree", "Ph.D. or higher"]
-).astype(int)
-
-df_emp['employed_fulltime'] = df_emp['employed'].map(
-    lambda x: x == 'Employed full-time'
-).astype(int)
-
-for field in df_emp.columns:
-    if '_agree' in field:
-        df_emp[field] = df_emp[field].map(lambda x: 0 if pd.isna(x) else agree_ratings[x])
-    elif '_confident' in field:
-        df_emp[field] = df_emp[field].map(lambda x: 0 if pd.isna(x) else confident_ratings[x])
-
+# (df, path, kwargs) for each output file; these are all written at the end
+exports = []
 
 # %%
-# helper functions
-def split_to_int(string):
-    return [int(x) for x in string.split('-')]
+# convert data to form where it can be analyzed easily
+# (survey answers are recoded with the value maps in schema.py)
 
-def split_to_float(string):
-    return [float(x) for x in string.split('-')]
+df_app = recode_applicants(df_app)
+df_emp = recode_employers(df_emp)
 
 # %%
 # create df of employer wage bids
-bids_list = []
-
-
-for i, row in df_emp.iterrows():
-    emp_is_female = int(row['gender'] == 'Female')
-    applicants = row['applicants'].split('-')
-    bids = split_to_float(row['bids'])
-    perform_guesses = split_to_int(row['perform_guesses'])
-    approp_rating = split_to_int(row['soc_approp_ratings'])
-    for j, (applicant, bid) in enumerate(zip(applicants, bids)):
-        try:
-            app_row = df_app.loc[applicant]
-        except KeyError:
-            # applicant was discarded
-            continue
-        promote_type_seen = 1 if j < 10 else 2 if j < 20 else 3
-        bids_list.append({
-            'employer': i,
-            'applicant': applicant,
-            'treatment': app_row['treatment'],
-            'emp_is_female': emp_is_female,
-            'app_is_female': app_row['female'],
-            'promote_type_seen': promote_type_seen,
-            'app_promote1': app_row['promote1'],
-            'app_promote2': app_row['promote2'],
-            'app_promote3_attentive': app_row['promote3_attentive'],
-            'app_promote3_boastful': app_row['promote3_boastful'],
-            'app_eval_correct': app_row['eval_correct'],
-            'bid': bid,
-            'perform_guess': perform_guesses[j],
-            'approp_rating': approp_rating[j] + 1,
-        })
-
-df_bids = pd.DataFrame(bids_list).set_index('employer')
+df_bids = build_bids(df_emp, df_app)
 
 # %%
+# index of bids by employer and by applicant
+bid_graph = BidGraph(df_bids)
+
 # add treatment field to df_emp
-df_emp['treatment'] = df_emp.index.map(lambda x: df_bids.loc[x]['treatment'].iloc[0])
+df_emp['treatment'] = bid_graph.employer_first('treatment')
 
 # %%
-df_bids.to_csv('employer_wage_bids.csv')
+exports.append((df_bids, 'employer_wage_bids.csv', {}))
+if parquet_available():
+    exports.append((df_bids, 'employer_wage_bids', {}))
 
 variable_labels = {
     'applicant': 'id of applicant being bid on',
@@ -236,50 +125,19 @@ value_labels = {
     }
 }
 
-df_bids.to_stata('employer_wage_bids.dta', variable_labels = variable_labels, value_labels = value_labels)
+exports.append((
+    df_bids, 'employer_wage_bids.dta',
+    {'variable_labels': variable_labels, 'value_labels': value_labels}
+))
 
 # %%
 # create df of applicant wage guesses
-wage_guesses = []
-
-for app_id, row in df_app.iterrows():
-    treatment = row['treatment']
-    guesser_is_female = int(row['gender'] == 'Female')
-    other_performance = split_to_int(row['wage_guess_perform'])
-    promote_type_seen = [x + 1 for x in split_to_int(row['wage_guess_promote_type'])]
-    other_promote1 = [x + 1 for x in split_to_int(row['wage_guess_promote1'])]
-    other_promote2 = split_to_int(row['wage_guess_promote2'])
-    other_promote3 = [x + 1 for x in split_to_int(row['wage_guess_promote3'])]
-    other_is_female = [
-        int(x == 'Female') for x in row['wage_guess_gender'].split('-')
-    ]
-    wage_guess = split_to_float(row['wage_guess_other'])
-    perform_guess = row['perform_guess_other'] if pd.isna(row['perform_guess_other']) else split_to_int(row['perform_guess_other'])
-    approp_guess = row['approp_guess_other'] if pd.isna(row['approp_guess_other']) else split_to_int(row['approp_guess_other'])
-
-    for i, (performance_, promote_type_, promote1_, promote2_, promote3_, other_is_female_, wage_guess_) in enumerate(zip(
-        other_performance, promote_type_seen, other_promote1, other_promote2, other_promote3, other_is_female, wage_guess
-    )):
-        wage_guesses.append({
-            'guesser': app_id,
-            'treatment': treatment,
-            'guesser_is_female': guesser_is_female,
-            'other_is_female': other_is_female_,
-            'promote_type_seen': promote_type_,
-            'other_promote1': promote1_,
-            'other_promote2': promote2_,
-            'other_promote3_attentive': int(promote3_ == 1),
-            'other_promote3_boastful': int(promote3_ == 2),
-            'other_eval_correct': performance_,
-            'wage_guess': wage_guess_,
-            'perform_guess': perform_guess[i] if isinstance(perform_guess, list) else perform_guess,
-            'approp_guess': approp_guess[i] + 1 if isinstance(approp_guess, list) else approp_guess,
-        })
-
-df_guesses = pd.DataFrame(wage_guesses).set_index('guesser')
+df_guesses = build_guesses(df_app)
 
 # %%
-df_guesses.to_csv('applicant_wage_guesses.csv')
+exports.append((df_guesses, 'applicant_wage_guesses.csv', {}))
+if parquet_available():
+    exports.append((df_guesses, 'applicant_wage_guesses', {}))
 
 variable_labels = {
     'treatment': 'treatment group for guesser',
@@ -318,38 +176,21 @@ value_labels = {
     }
 }
 
-df_guesses.to_stata('applicant_wage_guesses.dta', variable_labels = variable_labels, value_labels = value_labels)
+exports.append((
+    df_guesses, 'applicant_wage_guesses.dta',
+    {'variable_labels': variable_labels, 'value_labels': value_labels}
+))
 
 # %%
 # prune unnecessary columns from df_app
-df_app = df_app[[
-    'treatment',
-    'age',
-    'female',
-    'bachelors_or_higher',
-    'grad_degree',
-    'employed_fulltime',
-    'eval_correct',
-    'noneval_correct',
-    'avatar',
-    'promote1',
-    'promote2',
-    'promote3_attentive',
-    'promote3_boastful',
-    'study_topic_guess',
-    'male_avg_answers_guess',
-    'female_avg_answers_guess',
-    'credibility_of_100',
-    'counterfactual_promote',
-    'self_promote_reason',
-]]
+df_app = df_app[applicant_clean_columns]
 
 df_app.index.rename('applicant', inplace = True)
 
 # %%
 # export to csv
 
-df_app.to_csv('applicant_data_clean.csv')
+exports.append((df_app, 'applicant_data_clean.csv', {}))
 
 
 # add labels, then export to stata
@@ -387,48 +228,23 @@ value_labels = {
     'credibility_of_100': credibility_key,
 }
 
-df_app.applymap(
-    # remove non latin-1 characters
-    lambda x: x if not isinstance(x, str) else x.encode('latin-1', 'namereplace').decode('latin-1')
-).to_stata('applicant_data_clean.dta', variable_labels = variable_labels, value_labels = value_labels)
+# (non latin-1 characters are replaced on export)
+exports.append((
+    df_app, 'applicant_data_clean.dta',
+    {'variable_labels': variable_labels, 'value_labels': value_labels}
+))
 
 # %%
 # prune columns from df_emp
 
-df_emp = df_emp[[
-    'treatment',
-    'age',
-    'female',
-    'bachelors_or_higher',
-    'grad_degree',
-    'employed_fulltime',
-    'study_topic_guess',
-    'male_avg_answers_guess',
-    'female_avg_answers_guess',
-    'exit_survey_female_avatar',
-    'exit_survey_male_avatar',
-    'exit_survey_perform',
-    'exit_survey_promote',
-    'male_enjoy_agree',
-    'male_respect_agree',
-    'male_approachable_agree',
-    'male_interpersonal_agree',
-    'male_recommend_agree',
-    'male_confident_describe',
-    'female_enjoy_agree',
-    'female_respect_agree',
-    'female_approachable_agree',
-    'female_interpersonal_agree',
-    'female_recommend_agree',
-    'female_confident_describe',
-]]
+df_emp = df_emp[employer_clean_columns]
 
 df_emp.index.rename('employer', inplace = True)
 
 # %%
 # export to csv
 
-df_emp.to_csv('employer_data_clean.csv')
+exports.append((df_emp, 'employer_data_clean.csv', {}))
 
 
 # add labels, then export to stata
@@ -482,6 +298,11 @@ value_labels = {
     'female_confident_describe': confident_ratings_key,
 }
 
-df_emp.to_stata('employer_data_clean.dta', variable_labels = variable_labels, value_labels = value_labels)
-
+exports.append((
+    df_emp, 'employer_data_clean.dta',
+    {'variable_labels': variable_labels, 'value_labels': value_labels}
+))
 
+# %%
+# write all output files concurrently
+export_all(exports)
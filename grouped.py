@@ -0,0 +1,96 @@
+import numpy as np
+import pandas as pd
+
+from fitting import Engine
+from online import row_products
+from specs import Spec
+
+
+def grouped_ols(y, X, groups):
+    """
+    OLS of y on X separately within each group (a Clusters), for all groups at
+    once: the per-group X'X and X'y are sums over the groups' rows, and the
+    groups' systems are solved in one batched call.
+
+    Returns the coefficients and their (classical) standard errors as
+    (groups, k) arrays, the number of rows in each group, and each group's
+    status: 'ok'; 'perfect fit' when the residuals are all 0 (e.g. an
+    employer who bid the same on everyone), so the standard errors are 0;
+    'no residual df' when it has exactly as many rows as coefficients (which
+    are then exact, but have no standard errors); or 'no variation' when X
+    doesn't have full rank within the group (too few rows, or a regressor that
+    doesn't vary), for which everything is NaN.
+    """
+    X = np.asarray(X, dtype=float)
+    y = np.asarray(y, dtype=float)
+    k = X.shape[1]
+    G = len(groups)
+    XtX = groups.sums(row_products(X)).reshape(G, k, k)
+    Xty = groups.sums(X * y[:, None])
+    nobs = np.bincount(groups.codes, minlength=G)
+
+    full_rank = np.linalg.matrix_rank(XtX, hermitian=True) == k
+    params = np.full((G, k), np.nan)
+    params[full_rank] = np.linalg.solve(XtX[full_rank], Xty[full_rank, :, None])[:, :, 0]
+
+    resid = y - np.einsum('ij,ij->i', X, params[groups.codes])
+    ssr = np.bincount(groups.codes, weights=resid ** 2, minlength=G)
+    yty = np.bincount(groups.codes, weights=y ** 2, minlength=G)
+    df_resid = nobs - k
+    has_df = full_rank & (df_resid > 0)
+    bse = np.full((G, k), np.nan)
+    bread = np.linalg.inv(XtX[has_df])
+    bse[has_df] = np.sqrt(np.einsum('gii->gi', bread) * (ssr[has_df] / df_resid[has_df])[:, None])
+
+    status = np.where(full_rank, np.where(has_df, 'ok', 'no residual df'), 'no variation')
+    status[has_df & (ssr <= 1e-20 * yty)] = 'perfect fit'
+    return params, bse, nobs, status
+
+
+def group_fit(spec, keep=(), engine=None):
+    """
+    Fit spec separately for each of its clusters (e.g. each employer's bids),
+    with grouped_ols. Returns a tidy table, one row per (cluster, term), with
+    the coefficient, standard error, t, the cluster's number of rows and
+    status, and the first value of each column in `keep` within the cluster
+    (e.g. the employer's gender).
+    """
+    if spec.absorb:
+        raise ValueError('group fits need the fixed effects as dummies, not absorbed')
+    engine = engine or Engine(lean=True)
+    data = engine.data(spec)
+    X = engine.design(spec)
+    groups = engine.clusters(spec)
+    params, bse, nobs, status = grouped_ols(engine.outcome(spec), X, groups)
+
+    labels = pd.unique(np.asarray(data.index))
+    terms = list(X.columns)
+    k = len(terms)
+    table = pd.DataFrame({
+        'coef': params.ravel(),
+        'se': bse.ravel(),
+        't': np.divide(params, bse, out=np.full_like(params, np.nan), where=bse > 0).ravel(),
+        'nobs': np.repeat(nobs, k),
+        'status': np.repeat(status, k),
+    }, index=pd.MultiIndex.from_product([labels, terms], names=[data.index.name, 'term']))
+    first = np.unique(groups.codes, return_index=True)[1]
+    for c in keep:
+        table[c] = np.repeat(data[c].to_numpy()[first], k)
+    return table
+
+
+def employer_slopes(treatment, promote_type, engine=None):
+    """
+    Each employer's slope of their bids on the applicants' self-promotion
+    (and, in treatments 2 and 3, where they see it, on the applicants' gender),
+    from the bids in `treatment` on applicants with the given promote type
+    seen, along with the employer's gender.
+    """
+    terms = (f'app_promote{promote_type}',)
+    if treatment in (2, 3):
+        terms += ('app_is_female',)
+    spec = Spec(
+        'employer_wage_bids', 'bid', terms=terms,
+        where={'treatment': treatment, 'promote_type_seen': promote_type},
+    )
+    return group_fit(spec, keep=('emp_is_female',), engine=engine)
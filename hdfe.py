@@ -0,0 +1,41 @@
+import numpy as np
+import pandas as pd
+
+from absorb import Absorbed
+from bidgraph import BidGraph
+from ols import Clusters, ols
+
+
+def fit_twoway(df_bids, y='bid', terms=('perform_guess', 'approp_rating'), tol=1e-10, max_iter=10_000):
+    """
+    Regress `y` on `terms` in df_bids (or a subset of it), absorbing both
+    employer and applicant fixed effects, with standard errors clustered by
+    employer.
+
+    Works in the BidGraph layout of the bids: rows grouped by employer, so
+    employer means are sums over the CSR row ranges and applicant means are
+    bincounts over the applicant indices. Memory is linear in the number of
+    bids, however many employers and applicants there are, and the unbalanced
+    pattern of who bid on whom is handled as is. Terms are column names or
+    'a*b' products, as in specs.py.
+
+    Applicant characteristics (app_promote1, app_is_female...) are absorbed by
+    the applicant effects, so only terms that vary across an applicant's bids
+    can be estimated: the employer's guesses and ratings, or interactions such
+    as 'emp_is_female*app_promote1'.
+    """
+    columns = sorted({c for t in terms for c in t.split('*')} | {y})
+    graph = BidGraph(df_bids, columns=columns)
+    employers = Clusters.from_codes(graph.employer_of, len(graph.employers))
+    applicants = Clusters.from_codes(graph.indices, len(graph.applicants))
+    absorbed = Absorbed([employers, applicants], tol=tol, max_iter=max_iter)
+
+    def column(term):
+        col = np.ones(len(graph))
+        for c in term.split('*'):
+            col = col * graph.values[c]
+        return col
+
+    values = absorbed.demean(np.column_stack([graph.values[y], *(column(t) for t in terms)]))
+    X = pd.DataFrame(values[:, 1:], columns=list(terms))
+    return ols(values[:, 0], X, 'cluster', employers, absorbed.df(employers))
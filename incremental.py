@@ -0,0 +1,156 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from bidgraph import BidGraph
+from cleaning import (
+    applicant_clean_columns,
+    employer_clean_columns,
+    build_bids,
+    build_guesses,
+    drop_invalid,
+    recode_applicants,
+    recode_employers,
+    report_removed,
+)
+from datasets import parquet_available, write_partitioned
+from ragged import RaggedArray
+from schema import applicant_columns, employer_columns, read_raw
+from streaming import append_csv, bid_join_columns
+
+
+def load_state(path):
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        state = json.load(f)
+    state['applicants'] = set(state['applicants'])
+    state['employers'] = set(state['employers'])
+    return state
+
+
+def save_state(state, path):
+    with open(path, 'w') as f:
+        json.dump(
+            {
+                'watermark': state['watermark'],
+                'applicants': sorted(state['applicants']),
+                'employers': sorted(state['employers']),
+            },
+            f
+        )
+
+
+def select_new(df, processed, watermark):
+    """
+    Rows of a raw export not processed by an earlier run. Participants who
+    started after the watermark are new without checking the processed codes.
+    """
+    if watermark is None:
+        return df
+    started = pd.to_datetime(df['time_started'], utc=True)
+    new = (started > pd.Timestamp(watermark)).to_numpy()
+    new[~new] = ~df.index[~new].isin(processed)
+    return df[new]
+
+
+def bids_ready(df_emp, known_applicants):
+    """
+    Whether every applicant an employer bid on is already known (cleaned or
+    discarded), so none of their bids would be dropped for lack of a match.
+    """
+    applicants = RaggedArray.from_dashed(df_emp['applicants'])
+    unknown = ~np.isin(applicants.values, list(known_applicants))
+    return np.bincount(applicants.row_ids(), weights=unknown, minlength=len(df_emp)) == 0
+
+
+def read_clean_applicants(path='applicant_data_clean.csv'):
+    """The fields of previously cleaned applicants needed to join employer bids."""
+    return pd.read_csv(
+        path,
+        index_col='applicant',
+        usecols=['applicant', *bid_join_columns],
+        dtype={c: 'int8' for c in bid_join_columns},
+    )
+
+
+def clean_incremental(
+    state_path='format_data_state.json',
+    applicant_path='applicant_data.csv',
+    employer_path='employer_data.csv'
+):
+    """
+    Clean only the participants that are new since the last run (as recorded in
+    the state file), appending their rows to the clean csv outputs.
+
+    The first run (with no state file) writes the outputs from scratch. Employer
+    bids on applicants cleaned in earlier runs are joined against
+    applicant_data_clean.csv; employers who bid on applicants that are not in
+    the export yet are left for a later run. As with the streaming mode, only
+    the csv (and parquet) outputs are written.
+
+    Returns the new clean rows, by dataset name (as in datasets.py), e.g. to
+    fold into the regressions' saved moments with online.update_moments.
+    """
+    state = load_state(state_path)
+    first = state is None
+    if first:
+        state = {'watermark': None, 'applicants': set(), 'employers': set()}
+
+    df_app = select_new(
+        read_raw(applicant_path, applicant_columns), state['applicants'], state['watermark']
+    )
+    df_emp = select_new(
+        read_raw(employer_path, employer_columns), state['employers'], state['watermark']
+    )
+    # employers who bid on applicants that aren't in the export yet wait for a
+    # later run, so that those bids aren't dropped as if the applicant was discarded
+    ready = bids_ready(df_emp, state['applicants'].union(df_app.index))
+    print(
+        f'{len(df_app)} new applicants, {ready.sum()} new employers'
+        + (f' ({(~ready).sum()} waiting for applicants)' if not ready.all() else '')
+    )
+    df_emp = df_emp[ready]
+    processed_app, processed_emp = df_app.index, df_emp.index
+    started = pd.to_datetime(
+        pd.concat([df_app['time_started'], df_emp['time_started']]), utc=True
+    ).max()
+
+    df_app, removed = drop_invalid(df_app)
+    report_removed('applicants', removed)
+    df_emp, removed = drop_invalid(df_emp)
+    report_removed('employers', removed)
+
+    df_app = recode_applicants(df_app)
+    df_emp = recode_employers(df_emp)
+
+    df_guesses = build_guesses(df_app, float_optional=True)
+    append_csv(df_guesses, 'applicant_wage_guesses.csv', first)
+    if parquet_available():
+        write_partitioned(df_guesses, 'applicant_wage_guesses', append=not first)
+    df_app_clean = df_app[applicant_clean_columns].rename_axis('applicant')
+    append_csv(df_app_clean, 'applicant_data_clean.csv', first)
+
+    # bids can be on applicants from this run or from earlier ones
+    df_bids = build_bids(df_emp, read_clean_applicants())
+    append_csv(df_bids, 'employer_wage_bids.csv', first)
+    if parquet_available():
+        write_partitioned(df_bids, 'employer_wage_bids', append=not first)
+    df_emp['treatment'] = BidGraph(df_bids).employer_first('treatment')
+    append_csv(
+        df_emp[employer_clean_columns].rename_axis('employer'), 'employer_data_clean.csv', first
+    )
+
+    state['applicants'].update(processed_app)
+    state['employers'].update(processed_emp)
+    if pd.notna(started) and (state['watermark'] is None or started > pd.Timestamp(state['watermark'])):
+        state['watermark'] = started.isoformat()
+    save_state(state, state_path)
+
+    return {
+        'applicant_wage_guesses': df_guesses,
+        'applicant_data_clean': df_app_clean,
+        'employer_wage_bids': df_bids,
+    }
@@ -0,0 +1,116 @@
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from fitting import Engine
+from ols import Clusters, ols
+from online import row_products
+
+
+def leave_one_cluster_out(y, X, clusters):
+    """
+    The OLS coefficients without each cluster in turn, as a (clusters, k) array,
+    and which of those fits lost identification (e.g. a fixed-effect level only
+    seen in the dropped cluster).
+
+    With A = X'X and the dropped cluster's A_g = X_g'X_g and scores
+    s_g = X_g'e_g, the coefficients without it are b - (A - A_g)^-1 s_g: a
+    rank-k downdate of X'X per cluster, solved for all clusters in one batched
+    call instead of G refits. Unidentified fits use the pseudo-inverse, which
+    leaves the identified coefficients as they'd be with the lost columns dropped.
+    """
+    X = np.asarray(X, dtype=float)
+    k = X.shape[1]
+    fit = ols(y, X, 'cluster', clusters)
+    params = fit._params
+    A = X.T @ X
+    downdated = A - clusters.sums(row_products(X)).reshape(-1, k, k)
+    scores = clusters.sums(X * fit.resid[:, None])
+
+    singular = np.linalg.matrix_rank(downdated, hermitian=True) < k
+    shifts = np.empty_like(scores)
+    shifts[~singular] = np.linalg.solve(downdated[~singular], scores[~singular, :, None])[:, :, 0]
+    if singular.any():
+        shifts[singular] = (np.linalg.pinv(downdated[singular], hermitian=True) @ scores[singular, :, None])[:, :, 0]
+    return params - shifts, singular
+
+
+def jackknife(spec, terms=None, engine=None):
+    """
+    Leave-one-cluster-out diagnostics for spec's `terms` (by default all but
+    the fixed effects), dropping each cluster (employer, guesser, or row for
+    HC specs) in turn.
+
+    Returns two DataFrames. The first has, for each term, the coefficient, its
+    standard error as fitted, the CR3 (jackknife) standard error
+    sqrt((G-1)/G sum_g (b_-g - b)^2) with its normal p-value, and the most
+    influential cluster. The second has, for each (cluster, term), the
+    coefficient without the cluster, the change dfbeta = b - b_-g, dfbeta
+    relative to the fitted standard error, and whether that exceeds
+    2/sqrt(G) (the usual cutoff for DFBETAS, with clusters for observations),
+    or dropping the cluster flips the coefficient's sign.
+    """
+    if spec.absorb:
+        raise ValueError('the jackknife needs the fixed effects as dummies, not absorbed')
+    engine = engine or Engine(lean=True)
+    X = engine.design(spec)
+    y = engine.outcome(spec).to_numpy(dtype=float)
+    data = engine.data(spec)
+    if spec.cov_type == 'cluster':
+        clusters = engine.clusters(spec)
+        labels = pd.unique(np.asarray(data.index))
+    else:
+        clusters = Clusters.from_codes(np.arange(len(y)), len(y))
+        labels = np.asarray(data.index)
+    if terms is None:
+        terms = ['const', *spec.terms]
+    columns = [X.columns.get_loc(t) for t in terms]
+
+    fit = engine.fit(spec)
+    params = fit.params[terms].to_numpy()
+    bse = fit.bse[terms].to_numpy()
+    without, singular = leave_one_cluster_out(y, X.to_numpy(), clusters)
+    without = without[:, columns]
+    G = len(clusters)
+
+    dfbeta = params - without
+    se_cr3 = np.sqrt((G - 1) / G * (dfbeta ** 2).sum(axis=0))
+    dfbetas = dfbeta / bse
+    influence = pd.DataFrame({
+        'coef_without': without.ravel(),
+        'dfbeta': dfbeta.ravel(),
+        'dfbetas': dfbetas.ravel(),
+        'influential': (np.abs(dfbetas) > 2 / np.sqrt(G)).ravel(),
+        'sign_change': (np.sign(without) != np.sign(params)).ravel(),
+        'identified': np.repeat(~singular, len(terms)),
+    }, index=pd.MultiIndex.from_product([labels, terms], names=[data.index.name, 'term']))
+
+    most = np.abs(dfbetas).argmax(axis=0)
+    summary = pd.DataFrame({
+        'coef': params,
+        'se': bse,
+        'se_cr3': se_cr3,
+        'p_cr3': 2 * stats.norm.sf(np.abs(params / se_cr3)),
+        'most_influential': labels[most],
+        'max_dfbetas': dfbetas[most, np.arange(len(terms))],
+    }, index=pd.Index(terms, name='term'))
+    return summary, influence
+
+
+def influential_clusters(specs, top=3, engine=None):
+    """
+    The `top` most influential clusters for each term (but the constant) of each
+    spec that jackknife() can run on, flagged as there, indexed by (spec, term).
+    """
+    engine = engine or Engine(lean=True)
+    tables = {}
+    for name, spec in specs.items():
+        if spec.absorb:
+            continue
+        summary, influence = jackknife(spec, engine=engine)
+        influence = influence.reset_index(level=0).rename(columns={influence.index.names[0]: 'cluster'})
+        tables[name] = pd.concat([
+            influence.loc[[t]].sort_values('dfbetas', key=np.abs, ascending=False, kind='stable').head(top)
+            for t in summary.index if t != 'const'
+        ])
+    return pd.concat(tables, names=['spec'])
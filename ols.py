@@ -0,0 +1,214 @@
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+from scipy.linalg import lapack
+
+cov_types = ('cluster', 'HC0', 'HC1', 'HC2', 'HC3')
+
+
+class OLSResult:
+    """
+    The parts of a statsmodels OLS result that the tables use (params, bse,
+    tvalues, pvalues, cov_params(), conf_int()), without the rest. The pandas
+    objects are only built when asked for.
+
+    Inference is normal-based, as with statsmodels' robust covariances.
+    """
+
+    def __init__(self, params, cov, names, cov_type, n_groups, y, resid, df_absorbed=0, nobs=None):
+        self._params = params
+        self._cov = cov
+        self.names = names
+        self.nobs = len(y) if nobs is None else nobs
+        self.df_absorbed = df_absorbed
+        self.df_resid = self.nobs - len(names) - df_absorbed
+        self.cov_type = cov_type
+        self.n_groups = n_groups
+        self._y = y
+        self.resid = resid
+
+    @property
+    def ssr(self):
+        return self.resid @ self.resid
+
+    @property
+    def centered_tss(self):
+        centered = self._y - self._y.mean()
+        return centered @ centered
+
+    @property
+    def rsquared(self):
+        return 1 - self.ssr / self.centered_tss
+
+    @property
+    def params(self):
+        return pd.Series(self._params, index=self.names)
+
+    @property
+    def bse(self):
+        return pd.Series(np.sqrt(np.diag(self._cov)), index=self.names)
+
+    @property
+    def tvalues(self):
+        return pd.Series(self._params / np.sqrt(np.diag(self._cov)), index=self.names)
+
+    @property
+    def pvalues(self):
+        return pd.Series(2 * stats.norm.sf(np.abs(self.tvalues.to_numpy())), index=self.names)
+
+    def cov_params(self):
+        return pd.DataFrame(self._cov, index=self.names, columns=self.names)
+
+    def conf_int(self, alpha=0.05):
+        q = stats.norm.ppf(1 - alpha / 2)
+        params, bse = self.params, self.bse
+        return pd.DataFrame({0: params - q * bse, 1: params + q * bse})
+
+
+class Clusters:
+    """
+    Cluster membership of the rows of a dataset, prepared once so that it can be
+    reused across fits. Rows of a cluster are usually contiguous (the cleaned
+    tables are grouped by employer/guesser), in which case the per-cluster
+    sums are a reduceat over the run starts.
+    """
+
+    def __init__(self, labels):
+        self.codes, uniques = pd.factorize(np.asarray(labels))
+        self.n_groups = len(uniques)
+        self._find_runs()
+
+    @classmethod
+    def from_codes(cls, codes, n_groups):
+        """From integer codes 0..n_groups-1 (e.g. a BidGraph's), without factorizing."""
+        self = cls.__new__(cls)
+        self.codes = np.asarray(codes)
+        self.n_groups = n_groups
+        self._find_runs()
+        return self
+
+    def _find_runs(self):
+        starts = np.concatenate([[0], np.flatnonzero(np.diff(self.codes)) + 1])
+        contiguous = len(starts) == self.n_groups and (self.codes[starts] == np.arange(self.n_groups)).all()
+        self.starts = starts if contiguous else None
+
+    def __len__(self):
+        return self.n_groups
+
+    def sums(self, values):
+        """Sum the rows of the 2-d `values` within each cluster."""
+        if self.starts is not None:
+            return np.add.reduceat(values, self.starts, axis=0)
+        k = values.shape[1]
+        return np.bincount(
+            (self.codes[:, None] * k + np.arange(k)).ravel(),
+            weights=values.ravel(),
+            minlength=self.n_groups * k,
+        ).reshape(self.n_groups, k)
+
+
+class AggregateResult(OLSResult):
+    """OLSResult for a fit from aggregated data, with no row residuals."""
+
+    def __init__(self, params, cov, names, cov_type, n_groups, nobs, ssr, centered_tss, df_absorbed=0):
+        super().__init__(params, cov, names, cov_type, n_groups, None, None, df_absorbed, nobs)
+        self._ssr = ssr
+        self._centered_tss = centered_tss
+
+    @property
+    def ssr(self):
+        return self._ssr
+
+    @property
+    def centered_tss(self):
+        return self._centered_tss
+
+
+@lru_cache
+def strictly_lower(k):
+    return np.tril_indices(k, -1)
+
+
+def qr_solve(X, y):
+    """
+    Least squares of y on X by QR, X = QR: returns b = R^-1 Q'y and R^-1
+    (so that (X'X)^-1 = R^-1 R^-T). X needs to have full column rank. y can
+    be a matrix with one outcome per column, which all share the one QR.
+    """
+    k = X.shape[1]
+    Y = y if y.ndim == 2 else y[:, None]
+    qr, tau, _, _ = lapack.dgeqrf(X)
+    qty, _, _ = lapack.dormqr('L', 'T', qr, tau, Y, lwork=max(64, k, Y.shape[1]))
+    R_inv, info = lapack.dtrtri(qr[:k])
+    if info > 0:
+        raise np.linalg.LinAlgError('X does not have full column rank')
+    R_inv[strictly_lower(k)] = 0
+    params = R_inv @ qty[:k]
+    return (params if y.ndim == 2 else params[:, 0]), R_inv
+
+
+def correction(cov_type, n, k, n_groups=None):
+    """statsmodels' small-sample correction of a sandwich variance with n rows and k parameters."""
+    if cov_type == 'cluster':
+        return n_groups / (n_groups - 1) * (n - 1) / (n - k)
+    return n / (n - k) if cov_type == 'HC1' else 1
+
+
+def ols(y, X, cov_type='HC1', groups=None, df_absorbed=0):
+    """
+    OLS of y on X with robust standard errors, from one QR factorization of X.
+
+    cov_type is one of `cov_types`; 'cluster' needs `groups` (one label per row,
+    or a Clusters) and applies the same small-sample correction as statsmodels,
+    G/(G-1) * (N-1)/(N-K). X needs to have full column rank.
+
+    For y and X that have been demeaned to absorb fixed effects (see absorb.py),
+    `df_absorbed` is the number of parameters absorbed, which counts towards K.
+    """
+    return ols_outcomes(np.asarray(y, dtype=float)[:, None], X, cov_type, groups, df_absorbed)[0]
+
+
+def ols_outcomes(Y, X, cov_type='HC1', groups=None, df_absorbed=0):
+    """
+    ols() of each column of Y on the same X, returning a list of results.
+    The QR factorization, the bread and (for HC2/HC3) the leverages are shared,
+    and the sandwiches of all the outcomes are computed together.
+    """
+    names = list(X.columns) if isinstance(X, pd.DataFrame) else [f'x{i}' for i in range(X.shape[1])]
+    X = np.asarray(X, dtype=float)
+    Y = np.asarray(Y, dtype=float)
+    n, k = X.shape
+    m = Y.shape[1]
+    if df_absorbed and cov_type in ('HC2', 'HC3'):
+        raise ValueError(f'{cov_type} needs the leverage of the absorbed fixed effects')
+
+    params, R_inv = qr_solve(X, Y)
+    resid = Y - X @ params
+
+    n_groups = None
+    if cov_type == 'cluster':
+        clusters = groups if isinstance(groups, Clusters) else Clusters(groups)
+        n_groups = len(clusters)
+        # (outcomes, clusters, k) scores
+        scores = clusters.sums((resid.T[:, :, None] * X).transpose(1, 0, 2).reshape(n, m * k))
+        scores = scores.reshape(-1, m, k).transpose(1, 0, 2)
+        meat = scores.transpose(0, 2, 1) @ scores
+    elif cov_type in cov_types:
+        weights = resid ** 2
+        if cov_type in ('HC2', 'HC3'):
+            Q = X @ R_inv
+            leverage = np.einsum('ij,ij->i', Q, Q)
+            weights = weights / ((1 - leverage) ** (1 if cov_type == 'HC2' else 2))[:, None]
+        meat = (X.T[None] * weights.T[:, None, :]) @ X
+    else:
+        raise ValueError(f'unknown cov_type {cov_type}')
+
+    bread = R_inv @ R_inv.T
+    cov = correction(cov_type, n, k + df_absorbed, n_groups) * bread @ meat @ bread
+
+    return [
+        OLSResult(params[:, i], cov[i], names, cov_type, n_groups, Y[:, i], resid[:, i], df_absorbed)
+        for i in range(m)
+    ]
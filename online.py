@@ -0,0 +1,258 @@
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+from scipy import linalg
+
+from fitting import Engine
+from ols import AggregateResult, Clusters, correction
+
+# rows per block when forming the row-wise products x x'
+block_rows = 8192
+
+
+class Moments:
+    """
+    Sufficient statistics of a spec's OLS fit, which can be updated with new
+    rows and merged with the Moments of other rows (e.g. folded by other
+    processes), and give the same fit as the OLS on all the rows.
+
+    With z = x (x) x (the products of the regressors), the statistics are n,
+    y'y, X'X and X'y; for cluster-robust errors, X'X and X'y within each
+    cluster; and for HC0/HC1 errors, sum z z', sum z y x and sum z y^2, from
+    which the meat sum e^2 x x' follows for any coefficients.
+
+    Fixed-effect factors get a column for every level seen, identified by
+    (factor, level); the fit drops the last level seen, as the dummies in
+    fitting.Engine do.
+    """
+
+    def __init__(self, cov_type='cluster'):
+        if cov_type not in ('cluster', 'HC0', 'HC1'):
+            raise ValueError(f'{cov_type} errors can\'t be updated from moments')
+        self.cov_type = cov_type
+        self.names = []
+        self.n = 0
+        self.yy = 0.0
+        self.XtX = np.zeros((0, 0))
+        self.Xty = np.zeros(0)
+        # cluster-robust
+        self.cluster_labels = pd.Index([])
+        self.XtX_g = np.zeros((0, 0))
+        self.Xty_g = np.zeros((0, 0))
+        # HC
+        self.ZtZ = np.zeros((0, 0))
+        self.ZtyX = np.zeros((0, 0))
+        self.Zty2 = np.zeros(0)
+
+    def align(self, names):
+        """Add columns for any of `names` not seen yet (with zero moments)."""
+        new = [c for c in names if c not in self.names]
+        if not new:
+            return
+        k, m = len(self.names), len(self.names) + len(new)
+        self.names = self.names + new
+        pairs = np.add.outer(np.arange(k) * m, np.arange(k)).ravel()
+        self.XtX = pad(self.XtX, [(0, m - k), (0, m - k)])
+        self.Xty = pad(self.Xty, [(0, m - k)])
+        if self.cov_type == 'cluster':
+            XtX_g = np.zeros((len(self.cluster_labels), m * m))
+            XtX_g[:, pairs] = self.XtX_g
+            self.XtX_g = XtX_g
+            self.Xty_g = pad(self.Xty_g, [(0, 0), (0, m - k)])
+        else:
+            ZtZ = np.zeros((m * m, m * m))
+            ZtZ[np.ix_(pairs, pairs)] = self.ZtZ
+            self.ZtZ = ZtZ
+            ZtyX = np.zeros((m * m, m))
+            ZtyX[pairs, :k] = self.ZtyX
+            self.ZtyX = ZtyX
+            Zty2 = np.zeros(m * m)
+            Zty2[pairs] = self.Zty2
+            self.Zty2 = Zty2
+
+    def update(self, y, X, groups=None):
+        """
+        Fold in new rows: y, the DataFrame X (with columns named as in
+        design()) and, for cluster-robust errors, their cluster labels.
+        """
+        self.align(list(X.columns))
+        X = X.reindex(columns=self.names, fill_value=0).to_numpy(dtype=float)
+        y = np.asarray(y, dtype=float)
+        m = len(self.names)
+
+        self.n += len(y)
+        self.yy += y @ y
+        self.XtX += X.T @ X
+        self.Xty += X.T @ y
+
+        if self.cov_type == 'cluster':
+            clusters = Clusters(groups)
+            XtX_g = np.zeros((len(clusters), m * m))
+            for start in range(0, len(y), block_rows):
+                rows = slice(start, start + block_rows)
+                block = Clusters.from_codes(clusters.codes[rows], len(clusters))
+                XtX_g += block.sums(row_products(X[rows]))
+            Xty_g = clusters.sums(X * y[:, None])
+            self.add_clusters(pd.Index(np.asarray(groups)).unique(), XtX_g, Xty_g)
+        else:
+            for start in range(0, len(y), block_rows):
+                Xb, yb = X[start:start + block_rows], y[start:start + block_rows]
+                Z = row_products(Xb)
+                self.ZtZ += Z.T @ Z
+                self.ZtyX += Z.T @ (Xb * yb[:, None])
+                self.Zty2 += Z.T @ (yb * yb)
+
+    def add_clusters(self, labels, XtX_g, Xty_g):
+        labels = self.cluster_labels.append(pd.Index(labels))
+        codes, uniques = pd.factorize(labels)
+        groups = Clusters.from_codes(codes, len(uniques))
+        self.cluster_labels = pd.Index(uniques)
+        self.XtX_g = groups.sums(np.concatenate([self.XtX_g, XtX_g]))
+        self.Xty_g = groups.sums(np.concatenate([self.Xty_g, Xty_g]))
+
+    def merge(self, other):
+        """Add the moments of other rows (of the same spec) to these."""
+        if other.cov_type != self.cov_type:
+            raise ValueError('can\'t merge moments for different covariance types')
+        self.align(other.names)
+        other.align(self.names)
+        order = np.array([other.names.index(c) for c in self.names], dtype=int)
+        m = len(order)
+        pairs = np.add.outer(order * m, order).ravel()
+        self.n += other.n
+        self.yy += other.yy
+        self.XtX += other.XtX[np.ix_(order, order)]
+        self.Xty += other.Xty[order]
+        if self.cov_type == 'cluster':
+            self.add_clusters(other.cluster_labels, other.XtX_g[:, pairs], other.Xty_g[:, order])
+        else:
+            self.ZtZ += other.ZtZ[np.ix_(pairs, pairs)]
+            self.ZtyX += other.ZtyX[np.ix_(pairs, order)]
+            self.Zty2 += other.Zty2[pairs]
+        return self
+
+    def fit(self):
+        """The OLS fit on all the rows folded in so far."""
+        if self.n == 0:
+            raise ValueError('no rows folded in yet')
+        selected, names = self.columns()
+        m = len(self.names)
+        A = self.XtX[np.ix_(selected, selected)]
+        c = self.Xty[selected]
+        factor = linalg.cho_factor(A)
+        params = linalg.cho_solve(factor, c)
+        bread = linalg.cho_solve(factor, np.eye(len(selected)))
+        # the coefficients in terms of all the columns, 0 for the dropped ones
+        b = np.zeros(m)
+        b[selected] = params
+
+        n_groups = None
+        if self.cov_type == 'cluster':
+            n_groups = len(self.cluster_labels)
+            scores = self.Xty_g - (self.XtX_g.reshape(-1, m, m) @ b)
+            scores = scores[:, selected]
+            meat = scores.T @ scores
+        else:
+            meat = self.Zty2 - 2 * self.ZtyX @ b + self.ZtZ @ np.kron(b, b)
+            meat = meat.reshape(m, m)[np.ix_(selected, selected)]
+        cov = correction(self.cov_type, self.n, len(selected), n_groups) * bread @ meat @ bread
+
+        const = self.names.index('const')
+        return AggregateResult(
+            params, cov, names, self.cov_type, n_groups, self.n,
+            ssr=self.yy - 2 * params @ c + params @ A @ params,
+            centered_tss=self.yy - self.Xty[const] ** 2 / self.n,
+        )
+
+    def columns(self):
+        """
+        Positions and names of the columns to fit on: the constant and terms,
+        and the dummies of all but the last level seen of each factor, named
+        fe0, fe1, ... as in fitting.Engine.
+        """
+        seen = np.diag(self.XtX) > 0
+        selected = [i for i, c in enumerate(self.names) if not isinstance(c, tuple)]
+        names = [self.names[i] for i in selected]
+        factors = list(dict.fromkeys(c[0] for c in self.names if isinstance(c, tuple)))
+        for f in factors:
+            levels = sorted(
+                (c[1], i) for i, c in enumerate(self.names)
+                if isinstance(c, tuple) and c[0] == f and seen[i]
+            )
+            selected += [i for _, i in levels[:-1]]
+        names += [f'fe{i}' for i in range(len(selected) - len(names))]
+        return selected, names
+
+
+def pad(a, widths):
+    return np.pad(a, widths) if a.size or not a.ndim else np.zeros([w for _, w in widths])
+
+
+def row_products(X):
+    """z = x (x) x for each row x of X, as an (n, k * k) array."""
+    return (X[:, :, None] * X[:, None, :]).reshape(len(X), -1)
+
+
+def design(engine, spec):
+    """
+    Spec's design matrix, with a dummy for every level of its fixed-effect
+    factors, named (factor, level).
+    """
+    if spec.absorb:
+        raise ValueError('absorbed fixed effects can\'t be updated from moments')
+    data = engine.data(spec)
+    X = pd.DataFrame({'const': np.ones(len(data))}, index=data.index)
+    for t in spec.terms:
+        X[t] = engine.column(spec, t)
+    for f in spec.fe:
+        dummies = pd.get_dummies(data[f]).astype(float)
+        dummies.columns = [(f, level) for level in dummies.columns]
+        X = pd.concat([X, dummies], axis=1)
+    return X
+
+
+def fold(moments, engine, spec):
+    """Fold the rows of spec's subset in `engine` into `moments`."""
+    data = engine.data(spec)
+    if len(data):
+        groups = data.index if spec.cov_type == 'cluster' else None
+        moments.update(engine.outcome(spec), design(engine, spec), groups)
+    return moments
+
+
+def update_moments(specs, new_tables=None, path='regressions_moments.pkl'):
+    """
+    Fold new rows into the saved Moments of each spec, and return the fits.
+
+    `new_tables` maps dataset names (as in datasets.py) to DataFrames of new
+    cleaned rows, e.g. as returned by incremental.clean_incremental; only
+    those rows are read, so an update costs in proportion to the new data.
+    Specs with no saved moments (or whose definition has changed) are built
+    from the full datasets instead. A spec with no rows yet (e.g. the bids,
+    before any employer has bid) has None as its fit, and its empty moments
+    are saved for later rows to be folded into.
+    """
+    saved = {}
+    if os.path.exists(path):
+        with open(path, 'rb') as f:
+            saved = pickle.load(f)
+
+    full = Engine()
+    new = Engine(tables=new_tables or {})
+    fits = {}
+    for name, spec in specs.items():
+        if name in saved and saved[name][0] == spec:
+            moments = saved[name][1]
+            for dataset in (new_tables or {}):
+                if dataset == spec.dataset:
+                    fold(moments, new, spec)
+        else:
+            moments = fold(Moments(spec.cov_type), full, spec)
+        saved[name] = (spec, moments)
+        fits[name] = moments.fit() if moments.n else None
+
+    with open(path, 'wb') as f:
+        pickle.dump(saved, f)
+    return fits
@@ -0,0 +1,83 @@
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from datasets import load_dataset
+from fitting import Engine, spec_columns, subset_key
+
+# the Engine of a worker process, over the memory-mapped tables
+worker_engine = None
+
+
+def dump_tables(specs, directory):
+    """
+    Write the columns that `specs` use of each of their datasets to `directory`,
+    as a (columns, rows) float array and the codes of the index labels, and
+    return what's needed to map them back into DataFrames.
+    """
+    columns = {}
+    for spec in specs.values():
+        columns.setdefault(spec.dataset, set()).update(spec_columns(spec))
+    tables = {}
+    for name, cols in columns.items():
+        df = load_dataset(name)
+        cols = [c for c in df.columns if c in cols and c != df.index.name]
+        codes, labels = pd.factorize(df.index)
+        np.save(os.path.join(directory, f'{name}.npy'), df[cols].to_numpy(dtype=float).T)
+        np.save(os.path.join(directory, f'{name}.index.npy'), codes)
+        tables[name] = cols, df.index.name, np.asarray(labels)
+    return tables
+
+
+def map_tables(directory, tables):
+    """The DataFrames written by dump_tables, with their values memory-mapped read-only."""
+    frames = {}
+    for name, (columns, index_name, labels) in tables.items():
+        values = np.load(os.path.join(directory, f'{name}.npy'), mmap_mode='r')
+        codes = np.load(os.path.join(directory, f'{name}.index.npy'))
+        frames[name] = pd.DataFrame(
+            values.T, columns=columns, index=pd.Index(labels[codes], name=index_name), copy=False,
+        )
+    return frames
+
+
+def start_worker(directory, tables, lean, cache):
+    global worker_engine
+    worker_engine = Engine(lean=lean, tables=map_tables(directory, tables), cache=cache)
+
+
+def fit_specs(specs):
+    return worker_engine.fit_all(specs)
+
+
+def fit_parallel(specs, processes=None, lean=False, cache=None):
+    """
+    Engine(lean, cache=cache).fit_all(specs), spread over a pool of `processes` worker
+    processes (by default one per CPU). Specs on the same subset go to the same
+    worker, so that they share its columns (and factorizations, if lean).
+
+    The columns the specs use are written once to a temporary directory and
+    memory-mapped by every worker, rather than pickled to each, and the
+    results are returned in the order of `specs` whichever worker finishes
+    first. With a single process, the specs are fitted in this one.
+    """
+    processes = processes or os.cpu_count() or 1
+    if processes == 1:
+        return Engine(lean=lean, cache=cache).fit_all(specs)
+
+    batches = {}
+    for name, spec in specs.items():
+        batches.setdefault(subset_key(spec), {})[name] = spec
+    with tempfile.TemporaryDirectory() as directory:
+        tables = dump_tables(specs, directory)
+        with ProcessPoolExecutor(
+            max_workers=min(processes, len(batches)),
+            initializer=start_worker, initargs=(directory, tables, lean, cache),
+        ) as pool:
+            fitted = {}
+            for fits in pool.map(fit_specs, batches.values()):
+                fitted.update(fits)
+    return {name: fitted[name] for name in specs}
@@ -1,15 +1,30 @@
 # %%
 import pandas as pd
-import numpy as np
-import statsmodels.api as sm
 import re
 
+from fitcache import FitCache
+from fitting import Engine
+from specs import specs
+
 # %%
-df_bids = pd.read_csv('employer_wage_bids.csv', index_col='employer')
-df_bids['bid'] = df_bids['bid'] * 100
-df_guesses = pd.read_csv('applicant_wage_guesses.csv', index_col='guesser')
-df_guesses['wage_guess'] = df_guesses['wage_guess'] * 100
-df_app = pd.read_csv('applicant_data_clean.csv', index_col='applicant')
+engine = Engine(lean=True, cache=FitCache())
+
+def table_spec(name, **changes):
+    """The spec `name` from the registry, with bids and wage guesses in cents."""
+    spec = specs[name]
+    if spec.y in ('bid', 'wage_guess'):
+        changes.setdefault('y_scale', 100)
+    return spec._replace(**changes)
+
+def fit(name, **changes):
+    return engine.fit(table_spec(name, **changes))
+
+def self_eval_labels(promote, female, female_label='Female'):
+    return {
+        promote: 'Self-evaluation',
+        female: female_label,
+        f'{female}*{promote}': f'Self-evaluation x {female_label}',
+    }
 
 # %%
 def signif_level(pvalue):
@@ -22,7 +37,8 @@ def signif_level(pvalue):
     else:
         return ""
 
-def make_table(fitted_models, title=None, notes=None, colwidth=8):
+def make_table(fitted_models, labels=None, title=None, notes=None, colwidth=8):
+    labels = labels or {}
     tables = []
     for name, fitted in fitted_models.items():
         tables.append(
@@ -31,7 +47,7 @@ def make_table(fitted_models, title=None, notes=None, colwidth=8):
                     rf"\shortstack{{{param:.3g} ({bse:.2g}){signif_level(p)}}}"
                     for param, bse, p in zip(fitted.params, fitted.bse, fitted.pvalues)
                 ],
-                index=fitted.params.index,
+                index=[labels.get(term, term) for term in fitted.params.index],
                 columns = [name.replace('+', r'\newline +').replace('*', r'$^\dagger$')],
             )
         )
@@ -60,74 +76,13 @@ def make_table(fitted_models, title=None, notes=None, colwidth=8):
 
 # %%
 def hyp1_3_table(promote_type = 1):
-    data = df_bids[
-        (df_bids['treatment'] == 1) & (df_bids['promote_type_seen'] == promote_type)
-    ]
-    X = sm.add_constant(
-        data[f'app_promote{promote_type}']
-    )
-    X.columns=['const', 'Self-evaluation']
-
-    fitted1 = sm.OLS(data['bid'], X).fit(
-        cov_type='cluster', cov_kwds={'groups': data.index}
-    )
-
-    data = df_bids[
-        (df_bids['treatment'] == 2) & (df_bids['promote_type_seen'] == promote_type)
-    ]
-    X = pd.DataFrame(
-        sm.add_constant(
-            np.stack(
-                (
-                    data[f'app_promote{promote_type}'],
-                    data['app_is_female'],
-                    data['app_is_female'] * data[f'app_promote{promote_type}']
-                ),
-                axis=1
-            )
-        ),
-        columns = ['const', 'Self-evaluation', 'Female', 'Self-evaluation x Female'],
-        index = data.index
-    )
-    fitted2 = sm.OLS(data['bid'], X).fit(
-        cov_type='cluster', cov_kwds={'groups': data.index}
-    )
-
-    data = df_bids[
-        (df_bids['treatment'] == 3) & (df_bids['promote_type_seen'] == promote_type)
-    ]
-    X = pd.DataFrame(
-        sm.add_constant(
-            np.concatenate(
-                (
-                    np.stack(
-                        (
-                            data[f'app_promote{promote_type}'],
-                            data['app_is_female'],
-                            data['app_is_female'] * data[f'app_promote{promote_type}']
-                        ),
-                        axis=1
-                    ),
-                    pd.get_dummies(data['app_eval_correct']).to_numpy()[:, :-1]
-                ),
-                axis=1
-            )
-        ),
-        columns = [
-            'const', 'Self-evaluation', 'Female', 'Self-evaluation x Female',
-        ] + [f"fe{i}" for i in range(9)],
-        index = data.index
-    )
-    fitted3 = sm.OLS(data['bid'], X).fit(
-        cov_type='cluster', cov_kwds={'groups': data.index}
-    )
-
     return make_table(
         {
-            'Self-evaluation': fitted1,
-            r'Self-evaluation + gender': fitted2,
-            r'Self-evaluation + gender + performance*': fitted3
+            'Self-evaluation': fit(f'hyp1_promote{promote_type}'),
+            r'Self-evaluation + gender': fit(f'hyp2_promote{promote_type}'),
+            r'Self-evaluation + gender + performance*': fit(f'hyp3_promote{promote_type}')
         },
+        labels = self_eval_labels(f'app_promote{promote_type}', 'app_is_female'),
         title = f'Employer bids, with {"first" if promote_type == 1 else "second"} self-evaluation type',
         notes = ['*$p<0.1$, **$p<0.05$, ***$p<0.01$.', 'Standard errors clustered by employer.', '(†) indicates inclusion of performance fixed effects.']
     )
@@ -141,33 +96,22 @@ print(hyp1_3_table(2))
 
 # %%
 def get_hyp7_fit(treatment=None, promote_type=1):
-    data = df_app if treatment is None else df_app[df_app['treatment'] == treatment]
-    X = pd.DataFrame(
-        sm.add_constant(
-            np.concatenate(
-                (
-                    data['female'].to_numpy().reshape(-1, 1),
-                    pd.get_dummies(data['eval_correct']).to_numpy()[:, :-1]
-                ),
-                axis=1
-            )
-        ),
-        columns = ['const', 'Female'] + [f"fe{i}" for i in range(9)],
-        index = data.index
-    )
-    return sm.OLS(data[f'promote{promote_type}'], X).fit(
-        cov_type='HC1'
-    )
+    # both promote types are regressed on the same X, so they're fitted together
+    where = None if treatment is None else {'treatment': treatment}
+    return engine.fit_all({
+        p: table_spec(f'hyp7_promote{p}', where = where) for p in [1, 2]
+    })[promote_type]
 
 def hyp7_table(promote_type=1):
     fits = [get_hyp7_fit(t, promote_type) for t in [None, 1, 2, 3]]
     return make_table(
         {
             'All treatments': fits[0],
-            'Self-evaluation': fits[2],
+            'Self-evaluation': fits[1],
             'Self-evaluation + gender': fits[2],
             'Self-evaluation + gender + performance*': fits[3]
         },
+        labels = {'female': 'Female'},
         title = f'Applicant self-evaluation, with {"first" if promote_type == 1 else "second"} self-evaluation type',
         notes = ['*$p<0.1$, **$p<0.05$, ***$p<0.01$.', 'Standard errors clustered by applicant.', '(†) indicates inclusion of performance fixed effects.'],
     )
@@ -179,31 +123,12 @@ print(hyp7_table(1))
 print(hyp7_table(2))
 
 # %%
-def hyp4_fit(promote_type=1):
-    data = df_guesses[(df_guesses['treatment'] == 1) & (df_guesses['promote_type_seen'] == promote_type)]
-    X = pd.DataFrame(
-            sm.add_constant(
-            np.stack(
-                (
-                    data[f'other_promote{promote_type}'],
-                    data['guesser_is_female'],
-                    data['guesser_is_female'] * data[f'other_promote{promote_type}']
-                ),
-                axis=1
-            )
-        ),
-        columns = ['const', 'Self-evaluation', 'Female guesser', 'Self-evaluation x Female guesser'],
-        index = data.index
-    )
-    return sm.OLS(data['wage_guess'], X).fit(
-        cov_type='cluster', cov_kwds={'groups': data.index}
-    )
-
 def hyp4_table():
     return make_table(
         {
-            r'Second \newline self-evaluation type': hyp4_fit(2),
+            r'Second \newline self-evaluation type': fit('hyp4_promote2'),
         },
+        labels = self_eval_labels('other_promote2', 'guesser_is_female', 'Female guesser'),
         title = 'Wage guesses (self-evaluation-only treatment)',
         notes = ['*$p<0.1$, **$p<0.05$, ***$p<0.01$.', 'Standard errors clustered by guesser.',],
         colwidth = 12,
@@ -214,61 +139,14 @@ print(hyp4_table())
 
 # %%
 def hyp5_6_table(female = 1, promote_type = 1):
-    data = df_guesses[
-        (df_guesses['treatment'] == 2) & (df_guesses['promote_type_seen'] == promote_type) & (df_guesses['guesser_is_female'] == female)
-    ]
-    X = pd.DataFrame(
-        sm.add_constant(
-            np.stack(
-                (
-                    data[f'other_promote{promote_type}'],
-                    data['other_is_female'],
-                    data['other_is_female'] * data[f'other_promote{promote_type}']
-                ),
-                axis=1
-            ),
-        ),
-        columns = ['const', 'Self-evaluation', 'Female', 'Self-evaluation x Female'],
-        index = data.index
-    )
-
-    fitted1 = sm.OLS(data['wage_guess'], X).fit(
-        cov_type='cluster', cov_kwds={'groups': data.index}
-    )
-
-    data = df_guesses[(df_guesses['treatment'] == 3) & (df_guesses['promote_type_seen'] == promote_type) & df_guesses['guesser_is_female'] == female]
-    X = pd.DataFrame(
-        sm.add_constant(
-            np.concatenate(
-                (
-                    np.stack(
-                        (
-                            data['other_promote1'],
-                            data['other_is_female'],
-                            data['other_is_female'] * data['other_promote1']
-                        ),
-                        axis=1
-                    ),
-                    pd.get_dummies(data['other_eval_correct']).to_numpy()[:, :-1]
-                ),
-                axis=1
-            )
-        ),
-        columns = [
-            'const', 'Self-evaluation', 'Female', 'Self-evaluation x Female'
-        ] + [f"fe{i}" for i in range(10)],
-        index = data.index
-    )
-    fitted2 = sm.OLS(data['wage_guess'], X).fit(
-        cov_type='cluster', cov_kwds={'groups': data.index}
-    )
-
+    guessers = "female" if female == 1 else "male"
     return make_table(
         {
-            'Self-evaluation + gender': fitted1,
-            'Self-evaluation + gender + performance*': fitted2
+            'Self-evaluation + gender': fit(f'hyp5_promote{promote_type}_{guessers}'),
+            'Self-evaluation + gender + performance*': fit(f'hyp6_promote{promote_type}_{guessers}')
         },
-        title = f'Wage guesses, with {"first" if promote_type == 1 else "second"} self-evaluation type and {"female" if female == 1 else "male"} guessers only',
+        labels = self_eval_labels(f'other_promote{promote_type}', 'other_is_female'),
+        title = f'Wage guesses, with {"first" if promote_type == 1 else "second"} self-evaluation type and {guessers} guessers only',
         notes = ['*$p<0.1$, **$p<0.05$, ***$p<0.01$.', 'Standard errors clustered by guesser.', '(†) indicates inclusion of performance fixed effects.'],
     )
 
@@ -282,7 +160,4 @@ print(hyp5_6_table(1, 2))
 print(hyp5_6_table(0, 1))
 
 # %%
-print(hyp5_6_table(0, 2))
-
-
-
+print(hyp5_6_table(0, 2))
\ No newline at end of file
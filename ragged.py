@@ -0,0 +1,82 @@
+import numpy as np
+
+
+class RaggedArray:
+    """
+    A column of variable-length lists, stored as one flat typed array of values
+    plus an offsets array: row i is values[offsets[i]:offsets[i+1]].
+
+    Used for the dash-delimited list fields in the oTree exports
+    (e.g. bids = '1.52-1.67-0.55-...'), so each one is parsed only once.
+    """
+
+    def __init__(self, values, offsets):
+        self.values = np.asarray(values)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+
+    @classmethod
+    def from_lengths(cls, values, lengths):
+        offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        return cls(values, offsets)
+
+    @classmethod
+    def from_dashed(cls, col, dtype=str):
+        """
+        Parse a pandas Series of dash-delimited lists, converting the elements
+        to `dtype`. Missing (NaN) entries become empty rows.
+        """
+        present = col.notna().to_numpy()
+        lengths = np.zeros(len(col), dtype=np.int64)
+        lengths[present] = col[present].str.count('-').to_numpy() + 1
+        if present.any():
+            values = np.array('-'.join(col[present]).split('-')).astype(dtype)
+        else:
+            values = np.array([], dtype=dtype)
+        return cls.from_lengths(values, lengths)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        """
+        ra[i] is a view of row i's values; ra[a:b] is a RaggedArray sharing
+        the same values buffer.
+        """
+        if isinstance(i, slice):
+            start, stop, step = i.indices(len(self))
+            if step != 1:
+                raise ValueError('RaggedArray slices must be contiguous')
+            return RaggedArray(self.values, self.offsets[start:stop + 1])
+        return self.values[self.offsets[i]:self.offsets[i + 1]]
+
+    @property
+    def lengths(self):
+        return np.diff(self.offsets)
+
+    def row_ids(self):
+        """Row number of every element in self.values[offsets[0]:offsets[-1]]."""
+        return np.repeat(np.arange(len(self)), self.lengths)
+
+    def positions(self):
+        """Position within its row of every element."""
+        lengths = self.lengths
+        return np.arange(lengths.sum()) - np.repeat(self.offsets[:-1] - self.offsets[0], lengths)
+
+    def take(self, rows, positions, fill=None):
+        """
+        Vectorized lookup of element `positions[k]` of row `rows[k]`.
+
+        Positions past the end of a row give `fill`; with the default of None
+        they raise an IndexError instead.
+        """
+        rows = np.asarray(rows)
+        positions = np.asarray(positions)
+        in_row = (positions >= 0) & (positions < self.lengths[rows])
+        if fill is None:
+            if not in_row.all():
+                raise IndexError('position out of range for its row')
+            return self.values[self.offsets[rows] + positions]
+        idx = np.where(in_row, self.offsets[rows] + positions, 0)
+        found = self.values[idx] if len(self.values) else np.zeros(len(idx), dtype=self.values.dtype)
+        return np.where(in_row, found, fill)
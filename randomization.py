@@ -0,0 +1,160 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from fitting import Engine
+from ols import correction, ols
+from specs import indicators
+
+# bound on the number of permuted values handled at once (permutations x rows)
+chunk_values = 2 ** 22
+
+
+def randomization_test(
+    spec, B=100_000, assigned='treatment', strata=None, seed=0, engine=None, processes=None,
+):
+    """
+    Fisher randomization inference for the terms of spec that depend on the
+    randomly `assigned` column (e.g. treatment2 and treatment2*female in
+    hypotheses 8 and 9): under the sharp null that assignment has no effect,
+    re-assigning it by permuting it across rows gives the distribution of their
+    estimates. `strata` are the columns within whose levels the permutations
+    are done (e.g. ['female']); by default, across all the rows of spec's
+    subset. For cluster-robust specs, assignment is permuted across clusters
+    (employers or guessers were assigned a treatment, not each of their rows),
+    so it, and the strata, need to be constant within each cluster.
+
+    Returns, for each such term, the coefficient, its (HC1 or cluster) t, and
+    the randomization p-values of the two-sided tests based on the coefficient
+    and on t, from B permutations.
+
+    The other regressors Z don't change between permutations, so by
+    Frisch-Waugh-Lovell each permutation is the regression of M_Z y on the
+    permuted terms' M_Z D: a projection of all the permuted D in a chunk at
+    once, and a small batched solve. Permutations are drawn in chunks of at
+    most `chunk_values` values from seeds spawned from `seed`, and spread over
+    `processes` worker processes if given, with the same results either way.
+    """
+    if spec.absorb:
+        raise ValueError('randomization inference needs the fixed effects as dummies, not absorbed')
+    if spec.cov_type not in ('cluster', 'HC0', 'HC1'):
+        raise ValueError(f'can\'t use {spec.cov_type} errors in randomization inference')
+    engine = engine or Engine(lean=True)
+    data = engine.data(spec)
+    X = engine.design(spec)
+    y = engine.outcome(spec).to_numpy(dtype=float)
+    terms = [t for t in spec.terms if assigned in term_columns(t)]
+    if not terms:
+        raise ValueError(f'{spec.title or spec} has no terms depending on {assigned}')
+    n, k = X.shape
+    groups = engine.clusters(spec) if spec.cov_type == 'cluster' else None
+    fit = ols(y, X, spec.cov_type, groups)
+    observed = fit.params[terms].to_numpy()
+
+    # residualize y on the rest of the design, which doesn't depend on assignment
+    Z = X.drop(columns=terms).to_numpy()
+    Q = np.linalg.qr(Z)[0]
+    y_resid = y - Q @ (Q.T @ y)
+    # the other columns the terms multiply assignment by
+    factors = {
+        c: engine.column(spec, c)
+        for t in terms for c in t.split('*') if indicators.get(c, (c,))[0] != assigned
+    }
+    strata_codes = (
+        np.zeros(n, dtype=int) if not strata
+        else data.groupby(list(strata), sort=False).ngroup().to_numpy()
+    )
+    # the units assignment is permuted across: clusters, or rows
+    units = groups.codes if groups is not None else np.arange(n)
+    first = np.unique(units, return_index=True)[1]
+    for values in (data[assigned].to_numpy(), strata_codes):
+        if (values != values[first][units]).any():
+            raise ValueError(f'{assigned} and strata need to be constant within clusters')
+    setup = (
+        data[assigned].to_numpy()[first], strata_codes[first], units, terms, factors, Q, y_resid,
+        groups,
+        correction(spec.cov_type, n, k, None if groups is None else len(groups)),
+    )
+
+    size = max(1, chunk_values // n)
+    chunks = [min(size, B - start) for start in range(0, B, size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(chunks))
+    if processes:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            results = list(pool.map(permute, seeds, chunks, [setup] * len(chunks)))
+    else:
+        results = [permute(s, m, setup) for s, m in zip(seeds, chunks)]
+    params = np.concatenate([p for p, _ in results])
+    tvalues = np.concatenate([t for _, t in results])
+
+    t = observed / fit.bse[terms].to_numpy()
+    return pd.DataFrame(
+        {
+            'coef': observed,
+            't': t,
+            'p_coef': (np.abs(params) >= np.abs(observed)).mean(axis=0),
+            'p_t': (np.abs(tvalues) >= np.abs(t)).mean(axis=0),
+        },
+        index=pd.Index(terms, name='term'),
+    )
+
+
+def term_columns(term):
+    """The data columns that a term ('a', 'a*b' or an indicator) is built from."""
+    return {indicators.get(c, (c,))[0] for c in term.split('*')}
+
+
+def permute(seed, size, setup):
+    """
+    Coefficients and t values of the assigned terms for `size` permutations
+    of the assignment, as two (size, terms) arrays.
+    """
+    assigned, strata, units, terms, factors, Q, y_resid, clusters, c = setup
+    rng = np.random.default_rng(seed)
+    n = len(units)
+    shuffled = np.empty((size, len(assigned)), dtype=assigned.dtype)
+    for s in np.unique(strata):
+        members = np.flatnonzero(strata == s)
+        shuffled[:, members] = rng.permuted(np.broadcast_to(assigned[members], (size, len(members))), axis=1)
+    shuffled = shuffled[:, units]
+
+    D = np.empty((len(terms), size, n))
+    for i, term in enumerate(terms):
+        col = np.ones((size, n))
+        for f in term.split('*'):
+            if f in factors:
+                col = col * factors[f]
+            elif f in indicators:
+                col = col * (shuffled == indicators[f][1])
+            else:
+                col = col * shuffled
+        D[i] = col
+    # M_Z D for every permutation at once
+    D -= (D @ Q) @ Q.T
+
+    DtD = np.einsum('isn,jsn->sij', D, D)
+    Dty = np.einsum('isn,n->si', D, y_resid)
+    params = np.linalg.solve(DtD, Dty[:, :, None])[:, :, 0]
+    resid = y_resid - np.einsum('si,isn->sn', params, D)
+    scores = D * resid
+    if clusters is not None:
+        # sums of the scores within each cluster, for each term and permutation
+        scores = clusters.sums(scores.reshape(-1, n).T).T.reshape(len(terms), size, -1)
+    meat = np.einsum('isg,jsg->sij', scores, scores)
+    bread = np.linalg.inv(DtD)
+    cov = c * bread @ meat @ bread
+    return params, params / np.sqrt(np.einsum('sii->si', cov))
+
+
+def randomization_all(specs, assigned='treatment', **kwargs):
+    """randomization_test() for each spec with terms depending on `assigned`, indexed by (spec, term)."""
+    engine = kwargs.pop('engine', None) or Engine(lean=True)
+    return pd.concat(
+        {
+            name: randomization_test(spec, assigned=assigned, engine=engine, **kwargs)
+            for name, spec in specs.items()
+            if not spec.absorb and any(assigned in term_columns(t) for t in spec.terms)
+        },
+        names=['spec'],
+    )
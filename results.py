@@ -0,0 +1,81 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from datasets import parquet_available
+
+# columns of the result store, one row per (spec, term)
+result_columns = [
+    'spec', 'term', 'dataset', 'y', 'coef', 'se', 't', 'p', 'ci_low', 'ci_high',
+    'nobs', 'n_clusters', 'cov_type', 'rsquared',
+]
+
+
+def tidy(name, spec, fit, alpha=0.05):
+    """The rows of the result store for spec `name`'s fit (statsmodels' or an OLSResult)."""
+    ci = np.asarray(fit.conf_int(alpha))
+    n_groups = getattr(fit, 'n_groups', None)
+    return pd.DataFrame({
+        'spec': name,
+        'term': list(fit.params.index),
+        'dataset': spec.dataset,
+        'y': spec.y,
+        'coef': np.asarray(fit.params),
+        'se': np.asarray(fit.bse),
+        't': np.asarray(fit.tvalues),
+        'p': np.asarray(fit.pvalues),
+        'ci_low': ci[:, 0],
+        'ci_high': ci[:, 1],
+        'nobs': int(fit.nobs),
+        # pandas' nullable integer, as HC specs have no clusters
+        'n_clusters': pd.array([n_groups] * len(fit.params), dtype='Int64'),
+        'cov_type': fit.cov_type,
+        'rsquared': fit.rsquared,
+    })[result_columns]
+
+
+def results_table(specs, fits, alpha=0.05):
+    """The result store for a dict of specs and their fits, in the order of `specs`."""
+    return pd.concat([tidy(name, spec, fits[name], alpha) for name, spec in specs.items()], ignore_index=True)
+
+
+def write_results(table, path='regressions.parquet'):
+    """
+    Write the result store as parquet, or as csv (at the same path with a .csv
+    extension) when pyarrow isn't installed. Returns the path written.
+    """
+    if parquet_available():
+        table.to_parquet(path, index=False)
+        return path
+    path = os.path.splitext(path)[0] + '.csv'
+    table.to_csv(path, index=False)
+    return path
+
+
+def read_results(path='regressions.parquet'):
+    """Read a result store written by write_results."""
+    if path.endswith('.csv'):
+        return pd.read_csv(path, dtype={'n_clusters': 'Int64'})
+    return pd.read_parquet(path)
+
+
+def render(table, name, title=None, expect=None):
+    """
+    A plain-text view of spec `name`'s rows in the result store: the fit's
+    statistics and a coefficient table, under the spec's title.
+    """
+    rows = table[table['spec'] == name]
+    first = rows.iloc[0]
+    lines = [] if title is None else [title]
+    if expect is not None:
+        lines.append(f'expect to see {expect}')
+    clusters = '' if pd.isna(first['n_clusters']) else f'   clusters: {first["n_clusters"]}'
+    lines.append(
+        f'y: {first["y"]}   observations: {first["nobs"]}{clusters}'
+        f'   covariance: {first["cov_type"]}   R-squared: {first["rsquared"]:.3f}'
+    )
+    coefs = rows.set_index('term')[['coef', 'se', 't', 'p', 'ci_low', 'ci_high']]
+    coefs.index.name = None
+    lines.append(coefs.to_string(float_format=lambda x: f'{x:.4f}'))
+    return '\n'.join(lines)
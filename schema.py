@@ -0,0 +1,182 @@
+import pandas as pd
+
+# value maps for the survey answers in the raw oTree exports
+
+self_eval_ratings = {
+    'terrible': 1,
+    'not good': 2,
+    'neutral': 3,
+    'good': 4,
+    'very good': 5,
+    'exceptional': 6
+}
+self_eval_key = {v: k for k, v in self_eval_ratings.items()}
+
+credibility_ratings = {
+    'not credible': 1,
+    'somewhat not credible': 2,
+    'somewhat credible': 3,
+    'credible': 4,
+}
+credibility_key = {v: k for k, v in credibility_ratings.items()}
+
+self_eval_statement = {
+    '“I conduct all tasks assigned to me with the needed attention, and therefore I would work hard in a job that required me to perform well in tasks similar to the application questions.”': 1,
+    '“Usually I am the best at what I do, and therefore I would succeed in a job that required me to perform well in tasks similar to the application questions.”': 2,
+    'I prefer not to include either of these statements in my application.': 3,
+}
+
+# for the employer exit survey, unanswered questions map to 'na'
+agree_ratings = {
+    'na': 0,
+    'disagree strongly': 1,
+    'disagree': 2,
+    'agree': 3,
+    'strongly agree': 4,
+}
+agree_ratings_key = {v: k for k, v in agree_ratings.items()}
+
+confident_ratings = {
+    'na': 0,
+    'not confident': 1,
+    'somewhat confident': 2,
+    'appropriately confident': 3,
+    'overly confident': 4,
+}
+confident_ratings_key = {v: k for k, v in confident_ratings.items()}
+
+
+# columns of the raw exports used by format_data.py, with either their dtype or
+# the value map to recode them with (to int8), which are only applied to the rows
+# left after drop_invalid (see read_raw and recode_raw);
+# everything else (captcha tokens, mturk ids, q1-q32, page tracking...) is skipped
+
+index_column = 'participant.code'
+
+applicant_columns = {
+    'time_started': str,
+    'treatment': 'int8',
+    'age': 'int16',
+    'gender': 'category',
+    'education': 'category',
+    'employed': 'category',
+    'avatar': 'category',
+    'understanding1_attempts': 'int8',
+    'understanding2_attempts': 'int8',
+    'understanding3_attempts': 'int8',
+    'understanding4_attempts': 'int8',
+    'eval_correct': 'int8',
+    'noneval_correct': 'int8',
+    'self_eval': self_eval_ratings,
+    'self_eval_agree': 'int8',
+    'self_eval_statement': self_eval_statement,
+    'credibility_of_100': credibility_ratings,
+    'counterfactual_promote': self_eval_ratings,
+    'study_topic_guess': str,
+    'self_promote_reason': str,
+    'male_avg_answers_guess': 'float64',
+    'female_avg_answers_guess': 'float64',
+    'wage_guess_gender': str,
+    'wage_guess_perform': str,
+    'wage_guess_promote_type': str,
+    'wage_guess_promote1': str,
+    'wage_guess_promote2': str,
+    'wage_guess_promote3': str,
+    'wage_guess_other': str,
+    'perform_guess_other': str,
+    'approp_guess_other': str,
+}
+
+employer_columns = {
+    'time_started': str,
+    'age': 'int16',
+    'gender': 'category',
+    'education': 'category',
+    'employed': 'category',
+    'applicants': str,
+    'bids': str,
+    'perform_guesses': str,
+    'soc_approp_ratings': str,
+    'understanding1_attempts': 'int8',
+    'understanding2_attempts': 'int8',
+    'understanding3_attempts': 'int8',
+    'understanding4_attempts': 'int8',
+    'understanding5_attempts': 'int8',
+    'understanding6_attempts': 'int8',
+    'study_topic_guess': str,
+    'male_avg_answers_guess': 'float64',
+    'female_avg_answers_guess': 'float64',
+    'exit_survey_perform': 'int8',
+    'exit_survey_promote': 'int8',
+    'exit_survey_male_avatar': 'int8',
+    'exit_survey_female_avatar': 'int8',
+    'male_enjoy_agree': agree_ratings,
+    'male_respect_agree': agree_ratings,
+    'male_approachable_agree': agree_ratings,
+    'male_interpersonal_agree': agree_ratings,
+    'male_recommend_agree': agree_ratings,
+    'male_confident_describe': confident_ratings,
+    'female_enjoy_agree': agree_ratings,
+    'female_respect_agree': agree_ratings,
+    'female_approachable_agree': agree_ratings,
+    'female_interpersonal_agree': agree_ratings,
+    'female_recommend_agree': agree_ratings,
+    'female_confident_describe': confident_ratings,
+}
+
+
+def apply_value_map(col, value_map):
+    """
+    Recode a categorical column with `value_map`, touching only its categories.
+    Missing values map to value_map['na'] where the map has one.
+    """
+    col = col.cat.remove_unused_categories()
+    unknown = set(col.cat.categories) - set(value_map)
+    if unknown:
+        raise KeyError(f'no value for {sorted(unknown)} in {col.name}')
+    values = col.map(value_map).astype('float32')
+    if 'na' in value_map:
+        values = values.fillna(value_map['na'])
+    return values.astype('int8')
+
+
+def parse_dtype(t):
+    """
+    The dtype to read a column of the schema as: categorical for the value-mapped
+    ones and pandas' nullable integers for the integer ones, so that a row that
+    will be dropped can have a blank or unknown answer.
+    """
+    if isinstance(t, dict):
+        return 'category'
+    if isinstance(t, str) and t.startswith('int'):
+        return t.capitalize()
+    return t
+
+
+def recode_raw(df, columns):
+    """
+    Recode the value-mapped columns of a raw export read by read_raw and cast its
+    integer columns to their dtypes; called on the rows left after drop_invalid.
+    """
+    for c, t in columns.items():
+        if isinstance(t, dict):
+            df[c] = apply_value_map(df[c], t)
+        elif parse_dtype(t) != t:
+            df[c] = df[c].astype(t)
+    return df
+
+
+def read_raw(path, columns, chunksize=None):
+    """
+    Read a raw oTree export, parsing only `columns` (one of the dicts above) as
+    their parse_dtype; recode_raw then gives them their final dtypes.
+
+    With `chunksize`, returns an iterator over chunks of that many rows instead.
+    """
+    return pd.read_csv(
+        path,
+        index_col=index_column,
+        usecols=[index_column, *columns],
+        dtype={c: parse_dtype(t) for c, t in columns.items()},
+        chunksize=chunksize,
+    )
@@ -0,0 +1,98 @@
+from collections import namedtuple
+
+# A regression, described as data:
+#   dataset:  one of the cleaned tables in datasets.py
+#   y:        the dependent variable
+#   terms:    regressors (a constant is always added first); 'a*b' is the
+#             product of a and b, and names in `indicators` are dummies
+#   where:    filters passed to load_dataset, e.g. {'treatment': 1} or {'treatment': [1, 2]};
+#             None for the whole table
+#   fe:       factors controlled for with dummies (all but the last level), named fe0, fe1, ...
+#   absorb:   factors controlled for by demeaning instead (see absorb.py); only
+#             the terms are reported, without a constant
+#   cov_type: 'cluster' (by the table's index, i.e. employer, guesser or applicant) or 'HC1'
+#   y_scale:  multiplier for y, e.g. 100 to report bids in cents
+#   title, expect: printed above the summary in regressions.txt
+Spec = namedtuple(
+    'Spec',
+    ['dataset', 'y', 'terms', 'where', 'fe', 'absorb', 'cov_type', 'y_scale', 'title', 'expect'],
+    defaults=[None, (), (), 'cluster', 1, '', ''],
+)
+
+# dummies that can be used in terms
+indicators = {
+    'treatment2': ('treatment', 2),
+    'treatment3': ('treatment', 3),
+}
+
+promote_type_names = {1: 'first', 2: 'second'}
+
+# the hypothesis tests, in the order they're printed in regressions.txt
+specs = {}
+
+for p in [1, 2]:
+    specs[f'hyp1_promote{p}'] = Spec(
+        'employer_wage_bids', 'bid',
+        terms=(f'app_promote{p}',),
+        where={'treatment': 1, 'promote_type_seen': p},
+        title=f'test hypothesis 1 with {promote_type_names[p]} self-promotion type',
+        expect=f'app_promote{p} > 0',
+    )
+
+for h, t in [(2, 2), (3, 3)]:
+    for p in [1, 2]:
+        specs[f'hyp{h}_promote{p}'] = Spec(
+            'employer_wage_bids', 'bid',
+            terms=(f'app_promote{p}', 'app_is_female', f'app_is_female*app_promote{p}'),
+            where={'treatment': t, 'promote_type_seen': p},
+            fe=('app_eval_correct',) if h == 3 else (),
+            title=f'test hypothesis {h} with {promote_type_names[p]} self-promotion type',
+            expect=f'app_promote{p} > 0 and app_is_female*app_promote{p} < 0',
+        )
+
+for p in [1, 2]:
+    specs[f'hyp4_promote{p}'] = Spec(
+        'applicant_wage_guesses', 'wage_guess',
+        terms=(f'other_promote{p}', 'guesser_is_female', f'guesser_is_female*other_promote{p}'),
+        where={'treatment': 1, 'promote_type_seen': p},
+        title=f'test hypothesis 4 with {promote_type_names[p]} self-promotion type',
+        expect=f'other_promote{p} > 0 and guesser_is_female*other_promote{p} < 0',
+    )
+
+for h, t in [(5, 2), (6, 3)]:
+    for p in [1, 2]:
+        for female, guessers in [(1, 'female'), (0, 'male')]:
+            specs[f'hyp{h}_promote{p}_{guessers}'] = Spec(
+                'applicant_wage_guesses', 'wage_guess',
+                terms=(f'other_promote{p}', 'other_is_female', f'other_is_female*other_promote{p}'),
+                where={'treatment': t, 'promote_type_seen': p, 'guesser_is_female': female},
+                fe=('other_eval_correct',) if h == 6 else (),
+                title=(
+                    f'test hypothesis {h} with {promote_type_names[p]} self-promotion type'
+                    f' and {guessers} guessers only'
+                ),
+                expect=f'other_promote{p} > 0 and other_is_female*other_promote{p} < 0',
+            )
+
+for p in [1, 2]:
+    specs[f'hyp7_promote{p}'] = Spec(
+        'applicant_data_clean', f'promote{p}',
+        terms=('female',),
+        fe=('eval_correct',),
+        cov_type='HC1',
+        title=f'test hypothesis 7 with {promote_type_names[p]} self-promotion type',
+        expect='female < 0',
+    )
+
+for h, treatments in [(8, [1, 2]), (9, [2, 3])]:
+    t = treatments[1]
+    for p in [1, 2]:
+        specs[f'hyp{h}_promote{p}'] = Spec(
+            'applicant_data_clean', f'promote{p}',
+            terms=('female', f'treatment{t}', f'treatment{t}*female'),
+            where={'treatment': treatments},
+            fe=('eval_correct',),
+            cov_type='HC1',
+            title=f'test hypothesis {h} with {promote_type_names[p]} self-promotion type',
+            expect=f'treatment{t} = 0 and treatment{t}*female < 0',
+        )
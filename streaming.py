@@ -0,0 +1,97 @@
+import pandas as pd
+
+from bidgraph import BidGraph
+from cleaning import (
+    applicant_clean_columns,
+    employer_clean_columns,
+    build_bids,
+    build_guesses,
+    drop_invalid,
+    recode_applicants,
+    recode_employers,
+    report_removed,
+)
+from datasets import parquet_available, write_partitioned
+from schema import applicant_columns, employer_columns, read_raw
+
+# applicant fields that build_bids attaches to each employer bid
+bid_join_columns = [
+    'treatment',
+    'female',
+    'promote1',
+    'promote2',
+    'promote3_attentive',
+    'promote3_boastful',
+    'eval_correct',
+]
+
+
+def append_csv(df, path, first):
+    df.to_csv(path, mode='w' if first else 'a', header=first)
+
+
+def add_removed(total, removed):
+    for rule, n in removed.items():
+        total[rule] = total.get(rule, 0) + n
+
+
+def clean_applicants_in_chunks(path, chunksize):
+    """
+    Clean the applicant export `chunksize` rows at a time, appending to
+    applicant_data_clean.csv and applicant_wage_guesses.csv.
+
+    Returns the (compact) table of applicant fields needed to join employer bids.
+    """
+    removed_total = {}
+    join_table = []
+    for i, chunk in enumerate(read_raw(path, applicant_columns, chunksize)):
+        chunk, removed = drop_invalid(chunk)
+        add_removed(removed_total, removed)
+        chunk = recode_applicants(chunk)
+        df_guesses = build_guesses(chunk, float_optional=True)
+        append_csv(df_guesses, 'applicant_wage_guesses.csv', i == 0)
+        if parquet_available():
+            write_partitioned(df_guesses, 'applicant_wage_guesses', append=i > 0)
+        append_csv(
+            chunk[applicant_clean_columns].rename_axis('applicant'), 'applicant_data_clean.csv', i == 0
+        )
+        join_table.append(chunk[bid_join_columns])
+    report_removed('applicants', removed_total)
+    return pd.concat(join_table)
+
+
+def clean_employers_in_chunks(path, chunksize, df_app):
+    """
+    Clean the employer export `chunksize` rows at a time, appending to
+    employer_data_clean.csv and employer_wage_bids.csv.
+
+    df_app only needs the columns in bid_join_columns.
+    """
+    removed_total = {}
+    for i, chunk in enumerate(read_raw(path, employer_columns, chunksize)):
+        chunk, removed = drop_invalid(chunk)
+        add_removed(removed_total, removed)
+        chunk = recode_employers(chunk)
+        df_bids = build_bids(chunk, df_app)
+        append_csv(df_bids, 'employer_wage_bids.csv', i == 0)
+        if parquet_available():
+            write_partitioned(df_bids, 'employer_wage_bids', append=i > 0)
+        chunk['treatment'] = BidGraph(df_bids).employer_first('treatment')
+        append_csv(
+            chunk[employer_clean_columns].rename_axis('employer'), 'employer_data_clean.csv', i == 0
+        )
+    report_removed('employers', removed_total)
+
+
+def clean_in_chunks(chunksize, applicant_path='applicant_data.csv', employer_path='employer_data.csv'):
+    """
+    Clean the raw exports `chunksize` rows at a time, appending to the clean csv
+    outputs as it goes, so memory use stays bounded however large the exports
+    are. Only a few int8 fields per applicant are held for the whole run, to
+    join against the employer bids.
+
+    Stata files can't be written incrementally, so only the csv (and parquet)
+    outputs are produced.
+    """
+    df_app = clean_applicants_in_chunks(applicant_path, chunksize)
+    clean_employers_in_chunks(employer_path, chunksize, df_app)
@@ -0,0 +1,456 @@
+"""
+Checks that the cleaning code gives the same outputs as the original
+format_data.py, and that the fitting code gives the same results as
+statsmodels (or as naive refits) on the regressions in specs.py, run with
+`python -m pytest`.
+
+The cleaned data are built from the raw exports with format_data.py, in a
+temporary directory, once per run.
+"""
+import os
+import shutil
+import subprocess
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+import statsmodels.api as sm
+
+from bootstrap import wild_bootstrap, wild_weights
+from cellindex import CellIndex, indexed_tables
+from cleaning import build_bids, build_guesses, drop_invalid, recode_applicants, recode_employers
+from datasets import filter_rows, load_dataset, partitioned_tables
+from fitcache import FitCache
+from fitting import Engine
+from grouped import employer_slopes
+from hdfe import fit_twoway
+from incremental import clean_incremental
+from jackknife import leave_one_cluster_out
+from ols import Clusters, cov_types, ols
+from online import Moments, fold, update_moments
+from randomization import randomization_test
+from results import read_results, render, result_columns, results_table, write_results
+from schema import (
+    applicant_columns, employer_columns, read_raw, self_eval_ratings, self_eval_statement,
+)
+from specs import specs
+
+root = os.path.dirname(os.path.abspath(__file__))
+
+
+def assert_close(actual, expected):
+    np.testing.assert_allclose(np.asarray(actual), np.asarray(expected), rtol=1e-9, atol=1e-10)
+
+
+@pytest.fixture(scope='session', autouse=True)
+def cleaned_data(tmp_path_factory):
+    directory = tmp_path_factory.mktemp('data')
+    for raw in ('applicant_data.csv', 'employer_data.csv'):
+        shutil.copy(os.path.join(root, raw), directory)
+    subprocess.run(
+        [sys.executable, os.path.join(root, 'format_data.py')],
+        cwd=directory, check=True, stdout=subprocess.DEVNULL,
+    )
+    cwd = os.getcwd()
+    os.chdir(directory)
+    yield directory
+    os.chdir(cwd)
+
+
+def original_cleaning():
+    """
+    The valid participants and the bids and wage guesses, built row by row as
+    in the original format_data.py.
+    """
+    df_app = pd.read_csv(os.path.join(root, 'applicant_data.csv'), index_col=0)
+    df_emp = pd.read_csv(os.path.join(root, 'employer_data.csv'), index_col=0)
+    df_app = df_app[df_app['gender'] != 'Other']
+    df_emp = df_emp[df_emp['gender'] != 'Other']
+
+    def valid(row):
+        return all(row[x] < 3 for x in row.index if 'attempts' in x)
+
+    df_app = df_app[[valid(row) for _, row in df_app.iterrows()]]
+    df_emp = df_emp[[valid(row) for _, row in df_emp.iterrows()]]
+
+    df_app['treatment'] = df_app['treatment'].map(lambda x: x + 1).astype(int)
+    df_app['female'] = (df_app['gender'] == 'Female').astype(int)
+    df_app['promote1'] = df_app['self_eval'].apply(lambda x: self_eval_ratings[x])
+    df_app['promote2'] = df_app['self_eval_agree'].astype(int)
+    promote3 = df_app['self_eval_statement'].apply(lambda x: self_eval_statement[x])
+    df_app['promote3_attentive'] = (promote3 == 1).astype(int)
+    df_app['promote3_boastful'] = (promote3 == 2).astype(int)
+    df_app['eval_correct'] = df_app['eval_correct'].astype(int)
+
+    def split_to_int(string):
+        return [int(x) for x in string.split('-')]
+
+    def split_to_float(string):
+        return [float(x) for x in string.split('-')]
+
+    bids_list = []
+    for i, row in df_emp.iterrows():
+        emp_is_female = int(row['gender'] == 'Female')
+        applicants = row['applicants'].split('-')
+        bids = split_to_float(row['bids'])
+        perform_guesses = split_to_int(row['perform_guesses'])
+        approp_rating = split_to_int(row['soc_approp_ratings'])
+        for j, (applicant, bid) in enumerate(zip(applicants, bids)):
+            try:
+                app_row = df_app.loc[applicant]
+            except KeyError:
+                # applicant was discarded
+                continue
+            promote_type_seen = 1 if j < 10 else 2 if j < 20 else 3
+            bids_list.append({
+                'employer': i,
+                'applicant': applicant,
+                'treatment': app_row['treatment'],
+                'emp_is_female': emp_is_female,
+                'app_is_female': app_row['female'],
+                'promote_type_seen': promote_type_seen,
+                'app_promote1': app_row['promote1'],
+                'app_promote2': app_row['promote2'],
+                'app_promote3_attentive': app_row['promote3_attentive'],
+                'app_promote3_boastful': app_row['promote3_boastful'],
+                'app_eval_correct': app_row['eval_correct'],
+                'bid': bid,
+                'perform_guess': perform_guesses[j],
+                'approp_rating': approp_rating[j] + 1,
+            })
+    df_bids = pd.DataFrame(bids_list).set_index('employer')
+
+    wage_guesses = []
+    for app_id, row in df_app.iterrows():
+        other_performance = split_to_int(row['wage_guess_perform'])
+        promote_type_seen = [x + 1 for x in split_to_int(row['wage_guess_promote_type'])]
+        other_promote1 = [x + 1 for x in split_to_int(row['wage_guess_promote1'])]
+        other_promote2 = split_to_int(row['wage_guess_promote2'])
+        other_promote3 = [x + 1 for x in split_to_int(row['wage_guess_promote3'])]
+        other_is_female = [int(x == 'Female') for x in row['wage_guess_gender'].split('-')]
+        wage_guess = split_to_float(row['wage_guess_other'])
+        perform_guess = row['perform_guess_other'] if pd.isna(row['perform_guess_other']) else split_to_int(row['perform_guess_other'])
+        approp_guess = row['approp_guess_other'] if pd.isna(row['approp_guess_other']) else split_to_int(row['approp_guess_other'])
+        for i, values in enumerate(zip(
+            other_performance, promote_type_seen, other_promote1, other_promote2, other_promote3, other_is_female, wage_guess
+        )):
+            performance_, promote_type_, promote1_, promote2_, promote3_, other_is_female_, wage_guess_ = values
+            wage_guesses.append({
+                'guesser': app_id,
+                'treatment': row['treatment'],
+                'guesser_is_female': int(row['gender'] == 'Female'),
+                'other_is_female': other_is_female_,
+                'promote_type_seen': promote_type_,
+                'other_promote1': promote1_,
+                'other_promote2': promote2_,
+                'other_promote3_attentive': int(promote3_ == 1),
+                'other_promote3_boastful': int(promote3_ == 2),
+                'other_eval_correct': performance_,
+                'wage_guess': wage_guess_,
+                'perform_guess': perform_guess[i] if isinstance(perform_guess, list) else perform_guess,
+                'approp_guess': approp_guess[i] + 1 if isinstance(approp_guess, list) else approp_guess,
+            })
+    df_guesses = pd.DataFrame(wage_guesses).set_index('guesser')
+
+    return df_app, df_emp, df_bids, df_guesses
+
+
+def test_cleaning():
+    # the integer columns are narrower than the original's int64
+    df_app, df_emp, df_bids, df_guesses = original_cleaning()
+    applicants, _ = drop_invalid(read_raw(os.path.join(root, 'applicant_data.csv'), applicant_columns))
+    employers, _ = drop_invalid(read_raw(os.path.join(root, 'employer_data.csv'), employer_columns))
+    assert applicants.index.equals(df_app.index)
+    assert employers.index.equals(df_emp.index)
+    applicants, employers = recode_applicants(applicants), recode_employers(employers)
+    pd.testing.assert_frame_equal(build_bids(employers, applicants), df_bids, check_dtype=False)
+    pd.testing.assert_frame_equal(build_guesses(applicants), df_guesses, check_dtype=False)
+
+
+@pytest.fixture(scope='session')
+def reference():
+    return Engine()
+
+
+@pytest.mark.parametrize('name', list(specs))
+def test_lean(name, reference):
+    fit, expected = Engine(lean=True).fit(specs[name]), reference.fit(specs[name])
+    assert_close(fit.params, expected.params)
+    assert_close(fit.bse, expected.bse)
+    assert_close(fit.rsquared, expected.rsquared)
+
+
+@pytest.mark.parametrize('cov_type', [c for c in cov_types if c != 'cluster'])
+def test_hc(cov_type, reference):
+    spec = specs['hyp8_promote1']
+    y, X = reference.outcome(spec), reference.design(spec)
+    fit, expected = ols(y, X, cov_type), sm.OLS(y, X).fit(cov_type=cov_type)
+    assert_close(fit.params, expected.params)
+    assert_close(fit.bse, expected.bse)
+
+
+@pytest.mark.parametrize('name', [n for n, s in specs.items() if s.fe and s.cov_type == 'cluster'])
+def test_absorb(name, reference):
+    # fixed effects not nested in the clusters, absorbed or as dummies
+    spec = specs[name]
+    fit = Engine(lean=True).fit(spec._replace(fe=(), absorb=spec.fe))
+    expected = reference.fit(spec)
+    terms = list(spec.terms)
+    assert_close(fit.params[terms], expected.params[terms])
+    assert_close(fit.bse[terms], expected.bse[terms])
+
+
+def test_twoway():
+    # the dummy regression, with the same degrees of freedom as fit_twoway: the
+    # employer effects are nested in the employer clusters, so only the
+    # applicant effects count towards K
+    bids = load_dataset('employer_wage_bids', treatment=2)
+    terms = ['perform_guess', 'emp_is_female*app_promote1']
+    fit = fit_twoway(bids, terms=terms)
+
+    X = np.column_stack([
+        bids['perform_guess'], bids['emp_is_female'] * bids['app_promote1'],
+        pd.get_dummies(bids.index).to_numpy(dtype=float),
+        pd.get_dummies(bids['applicant']).to_numpy(dtype=float),
+    ])
+    y = bids['bid'].to_numpy()
+    bread = np.linalg.pinv(X.T @ X)
+    params = bread @ X.T @ y
+    clusters = Clusters(bids.index)
+    scores = clusters.sums(X * (y - X @ params)[:, None])
+    n, G, k = len(y), len(clusters), len(terms) + bids['applicant'].nunique()
+    cov = G / (G - 1) * (n - 1) / (n - k) * bread @ scores.T @ scores @ bread
+    assert_close(fit.params, params[:2])
+    assert_close(fit.bse, np.sqrt(np.diag(cov)[:2]))
+
+
+@pytest.mark.parametrize('name', list(specs))
+def test_collapse(name, reference):
+    fit, expected = Engine(collapse=True).fit(specs[name]), reference.fit(specs[name])
+    assert_close(fit.params, expected.params)
+    assert_close(fit.bse, expected.bse)
+    assert_close(fit.rsquared, expected.rsquared)
+
+
+@pytest.mark.parametrize('name', list(specs))
+def test_merged_moments(name, reference):
+    # the subset's rows, folded into two Moments and merged
+    spec = specs[name]
+    data = reference.data(spec)
+    half = len(data) // 2
+    parts = [
+        fold(Moments(spec.cov_type), Engine(tables={spec.dataset: rows}), spec)
+        for rows in (data.iloc[:half], data.iloc[half:])
+    ]
+    fit, expected = parts[0].merge(parts[1]).fit(), reference.fit(spec)
+    assert_close(fit.params, expected.params)
+    assert_close(fit.bse, expected.bse)
+    assert_close(fit.rsquared, expected.rsquared)
+
+
+def test_update_moments(tmp_path, monkeypatch):
+    # the first sessions' applicants arrive before any employer has bid, so
+    # the bid specs have no rows until the second update
+    monkeypatch.chdir(tmp_path)
+    raw = {name: pd.read_csv(os.path.join(root, name)) for name in ('applicant_data.csv', 'employer_data.csv')}
+    cutoff = pd.to_datetime(raw['applicant_data.csv']['time_started'], utc=True).sort_values().iloc[300]
+    for name, df in raw.items():
+        df[pd.to_datetime(df['time_started'], utc=True) < cutoff].to_csv(name, index=False)
+    first = clean_incremental()
+    assert len(first['employer_wage_bids']) == 0
+    fits = update_moments(specs, first)
+    assert fits['hyp1_promote1'] is None
+    assert fits['hyp7_promote1'] is not None
+
+    for name, df in raw.items():
+        df.to_csv(name, index=False)
+    fits = update_moments(specs, clean_incremental())
+    expected = Engine().fit_all(specs)
+    for name in specs:
+        assert_close(fits[name].params, expected[name].params)
+        assert_close(fits[name].bse, expected[name].bse)
+
+
+def test_wild_bootstrap(reference):
+    # the same Rademacher draws, as refits of y* = y0 + v u0 under the null
+    spec, term, B = specs['hyp2_promote1'], 'app_is_female*app_promote1', 199
+    result = wild_bootstrap(spec, [term], B=B, seed=1)
+    y, X = reference.outcome(spec).to_numpy(), reference.design(spec)
+    clusters = reference.clusters(spec)
+    others = X.drop(columns=term).to_numpy()
+    u0 = y - others @ np.linalg.lstsq(others, y, rcond=None)[0]
+    seed = np.random.SeedSequence(1).spawn(1)[0]
+    v = np.random.default_rng(seed).choice(wild_weights['rademacher'], size=(B, len(clusters)))
+    t = ols(y, X, 'cluster', clusters).tvalues[term]
+    t_star = [ols(y - u0 + w[clusters.codes] * u0, X, 'cluster', clusters).tvalues[term] for w in v]
+    assert result.loc[term, 'pvalue'] == np.mean(np.square(t_star) >= t ** 2)
+
+
+def test_randomization(reference):
+    # the same permutations of treatment across applicants, as refits
+    spec, B = specs['hyp8_promote1'], 50
+    result = randomization_test(spec, B=B, seed=1)
+    data = reference.data(spec)
+    assigned = data['treatment'].to_numpy()
+    seed = np.random.SeedSequence(1).spawn(1)[0]
+    shuffled = np.random.default_rng(seed).permuted(np.broadcast_to(assigned, (B, len(assigned))), axis=1)
+    terms = list(result.index)
+    coefs, tvalues = [], []
+    for treatment in shuffled:
+        engine = Engine(lean=True, tables={spec.dataset: data.assign(treatment=treatment)})
+        fit = engine.fit(spec)
+        coefs.append(fit.params[terms])
+        tvalues.append(fit.tvalues[terms])
+    assert_close(result['p_coef'], (np.abs(coefs) >= np.abs(result['coef'].to_numpy())).mean(axis=0))
+    assert_close(result['p_t'], (np.abs(tvalues) >= np.abs(result['t'].to_numpy())).mean(axis=0))
+
+
+@pytest.mark.parametrize('name, gender', [
+    ('employer_wage_bids', 'emp_is_female'), ('applicant_wage_guesses', 'guesser_is_female'),
+])
+@pytest.mark.parametrize('where', [
+    {'treatment': 2},
+    {'treatment': 1, 'promote_type_seen': 3},
+    {'treatment': [1, 3]},
+    {'treatment': [2, 3], 'promote_type_seen': [1, 2]},
+    {'treatment': 3, 'gender': 1},
+    {'treatment': 4},
+])
+def test_cell_index(name, gender, where):
+    # the same rows as filter_rows, in the same order; the csv has the rows in
+    # the order format_data.py wrote them, not sorted by cell as the parquet is
+    where = {gender if c == 'gender' else c: v for c, v in where.items()}
+    df = pd.read_csv(f'{name}.csv', index_col=partitioned_tables[name][0])
+    pd.testing.assert_frame_equal(CellIndex(df, indexed_tables[name]).select(**where), filter_rows(df, where))
+
+
+def test_fit_cache(tmp_path, monkeypatch, reference):
+    # a second engine takes every fit from the cache, in dollars or in cents
+    cache = FitCache(tmp_path)
+    Engine(lean=True, cache=cache).fit_all(specs)
+
+    def refit(*args):
+        raise AssertionError('fitted instead of taken from the cache')
+
+    for y_scale in (1, 100):
+        scaled = {name: spec._replace(y_scale=y_scale) for name, spec in specs.items()}
+        engine = Engine(lean=True, cache=cache)
+        monkeypatch.setattr(engine, '_fit', refit)
+        monkeypatch.setattr(engine, 'fit_outcomes', refit)
+        fits = engine.fit_all(scaled)
+        for name, spec in scaled.items():
+            expected = reference.fit(spec)
+            assert_close(fits[name].params, expected.params)
+            assert_close(fits[name].bse, expected.bse)
+            assert_close(fits[name].rsquared, expected.rsquared)
+
+
+def test_fit_cache_key(reference):
+    # a change to the rows, or to the spec, is a different key
+    cache, spec = FitCache(), specs['hyp1_promote1']
+    data, columns = reference.data(spec), ['app_promote1', 'bid']
+    key = cache.key(spec, data, columns)
+    assert cache.key(spec._replace(title='other', y_scale=100), data.copy(), columns) == key
+    assert cache.key(spec, data.assign(bid=data['bid'] + 1e-9), columns) != key
+    assert cache.key(spec, data.iloc[1:], columns) != key
+    assert cache.key(spec._replace(cov_type='HC1'), data, columns) != key
+
+
+def test_fit_cache_eviction(tmp_path, reference):
+    # the least recently used entries are removed first, reading one counts as a use
+    cache = FitCache(tmp_path)
+    names = ['hyp1_promote1', 'hyp2_promote1', 'hyp3_promote1']
+    for i, name in enumerate(names):
+        cache.put(name, reference.fit(specs[name]))
+        os.utime(cache.file(name), (i, i))
+    assert cache.get(names[0]) is not None
+    sizes = {name: os.path.getsize(cache.file(name)) for name in names}
+    cache.max_bytes = sizes[names[0]] + sizes[names[2]]
+    cache.evict()
+    assert cache.get(names[1]) is None
+    assert cache.get(names[0]) is not None and cache.get(names[2]) is not None
+    assert cache.get('missing') is None
+
+
+@pytest.fixture(scope='session')
+def results(reference):
+    return results_table(specs, reference.fit_all(specs))
+
+
+def test_results_table(results, reference):
+    # the result store's rows against statsmodels' fits, and the same from the kernel in ols.py
+    assert list(results.columns) == result_columns
+    assert list(results['spec'].unique()) == list(specs)
+    for name, spec in specs.items():
+        fit, rows = reference.fit(spec), results[results['spec'] == name]
+        assert list(rows['term']) == list(fit.params.index)
+        assert_close(rows['coef'], fit.params)
+        assert_close(rows['se'], fit.bse)
+        assert_close(rows['t'], fit.tvalues)
+        assert_close(rows['p'], fit.pvalues)
+        assert_close(rows[['ci_low', 'ci_high']], fit.conf_int())
+        assert (rows['nobs'] == fit.nobs).all()
+        assert_close(rows['rsquared'], fit.rsquared)
+        if spec.cov_type == 'cluster':
+            assert (rows['n_clusters'] == len(reference.clusters(spec))).all()
+        else:
+            assert rows['n_clusters'].isna().all()
+    lean = results_table(specs, Engine(lean=True).fit_all(specs))
+    pd.testing.assert_frame_equal(lean, results, rtol=1e-9, atol=1e-10)
+
+
+def test_results_store(results, tmp_path, monkeypatch):
+    # as parquet, and as csv without pyarrow
+    path = write_results(results, str(tmp_path / 'regressions.parquet'))
+    pd.testing.assert_frame_equal(read_results(path), results)
+    monkeypatch.setattr('results.parquet_available', lambda: False)
+    path = write_results(results, str(tmp_path / 'regressions.parquet'))
+    assert path == str(tmp_path / 'regressions.csv')
+    pd.testing.assert_frame_equal(read_results(path), results, rtol=1e-15)
+
+
+@pytest.mark.parametrize('name', ['hyp1_promote1', 'hyp8_promote1'])
+def test_render(name, results, reference):
+    spec = specs[name]
+    fit = reference.fit(spec)
+    lines = render(results, name, spec.title, spec.expect).split('\n')
+    assert lines[:2] == [spec.title, f'expect to see {spec.expect}']
+    clusters = f'   clusters: {len(reference.clusters(spec))}' if spec.cov_type == 'cluster' else ''
+    assert lines[2] == (
+        f'y: {spec.y}   observations: {int(fit.nobs)}{clusters}'
+        f'   covariance: {spec.cov_type}   R-squared: {fit.rsquared:.3f}'
+    )
+    assert lines[3].split() == ['coef', 'se', 't', 'p', 'ci_low', 'ci_high']
+    assert len(lines) == 4 + len(fit.params)
+    ci = fit.conf_int()
+    for line, term in zip(lines[4:], fit.params.index):
+        values = [fit.params[term], fit.bse[term], fit.tvalues[term], fit.pvalues[term], *ci.loc[term]]
+        assert line.split() == [term] + [f'{x:.4f}' for x in values]
+    assert render(results, name).split('\n')[0].startswith('y: ')
+
+
+def test_leave_one_cluster_out(reference):
+    spec = specs['hyp3_promote1']
+    y, X = reference.outcome(spec).to_numpy(), reference.design(spec).to_numpy()
+    clusters = reference.clusters(spec)
+    without, singular = leave_one_cluster_out(y, X, clusters)
+    for g in np.flatnonzero(~singular):
+        keep = clusters.codes != g
+        assert_close(without[g], np.linalg.lstsq(X[keep], y[keep], rcond=None)[0])
+
+
+@pytest.mark.parametrize('treatment', [1, 2, 3])
+def test_grouped(treatment):
+    spec = specs[f'hyp{treatment}_promote1']
+    data = Engine().data(spec)
+    terms = ['app_promote1'] + (['app_is_female'] if treatment > 1 else [])
+    table = employer_slopes(treatment, 1)
+    for employer, rows in data.groupby(level=0, sort=False):
+        fitted = table.loc[employer]
+        if fitted['status'].iloc[0] not in ('ok', 'perfect fit'):
+            continue
+        expected = sm.OLS(rows['bid'], sm.add_constant(rows[terms], has_constant='add')).fit()
+        assert_close(fitted['coef'], expected.params)
+        if fitted['status'].iloc[0] == 'ok':
+            assert_close(fitted['se'], expected.bse)